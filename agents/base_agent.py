@@ -3,11 +3,19 @@ from langchain.agents import create_react_agent
 from langfuse.callback import CallbackHandler
 from langchain_openai import ChatOpenAI
 from abc import abstractmethod
+from contextvars import ContextVar
 
 from utils.log_util import log_exception
 from utils.user_info import User
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import RemoveMessage
+
+from infrastructure.checkpointer import create_checkpointer, select_overflow_messages
+
+
+# 上层Agent通过工具调用子Agent时设置，使子Agent的事件（如流式token）回传给上层
+parent_callbacks = ContextVar("parent_callbacks", default=None)
 
 
 def _create_langfuse_callback(user_info: User):
@@ -18,6 +26,19 @@ def _create_langfuse_callback(user_info: User):
     )
 
 
+class ToolCallRecorder(BaseCallbackHandler):
+    """记录一次运行中（包括子Agent）调用过的工具，calls 为 [(工具名, 参数)]"""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls = []
+
+    def on_tool_start(self, serialized, input_str, *, inputs=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name")
+        self.calls.append((name, inputs if isinstance(inputs, dict) else {}))
+
+
 class BaseAgent:
     """基础Agent类，提供通用功能"""
 
@@ -32,15 +53,14 @@ class BaseAgent:
         self.agent_type = agent_type
         self.description = description
         self.tools = tools or []
-        self.agent_executor = create_react_agent(self.llm, self.tools, checkpointer=MemorySaver())
+        self.agent_executor = create_react_agent(self.llm, self.tools, checkpointer=create_checkpointer(name))
 
     def run(self, messages, user_info: User) -> str:
         """运行Agent"""
         try:
-            return self.agent_executor.invoke(input={"messages": messages},
-                                              config={"callbacks": [_create_langfuse_callback(user_info)],
-                                                      "configurable": {"thread_id": user_info.session_id}}
-                                              )
+            config = self._build_config(user_info)
+            self._trim_history(config)
+            return self.agent_executor.invoke(input={"messages": messages}, config=config)
         except Exception as e:
             log_exception(e)
             raise
@@ -48,15 +68,48 @@ class BaseAgent:
     async def arun(self, messages, user_info: User) -> str:
         """异步运行Agent"""
         try:
-            resp = await self.agent_executor.ainvoke(input={"messages":messages},
-                                              config={"callbacks": [_create_langfuse_callback(user_info)],
-                                                      "configurable": {"thread_id": user_info.session_id}}
-                                              )
+            config = self._build_config(user_info)
+            await self._atrim_history(config)
+            resp = await self.agent_executor.ainvoke(input={"messages": messages}, config=config)
             return resp
         except Exception as e:
             log_exception(e)
             raise
 
+    async def astream_events(self, messages, user_info: User):
+        """异步运行Agent，逐个产出LangGraph事件（包括token、工具调用和子Agent的事件）"""
+        try:
+            config = self._build_config(user_info)
+            await self._atrim_history(config)
+            async for event in self.agent_executor.astream_events({"messages": messages}, config=config, version="v2"):
+                yield event
+        except Exception as e:
+            log_exception(e)
+            raise
+
+    def _build_config(self, user_info: User) -> dict:
+        """构建运行配置，作为子Agent被调用时沿用上层的回调"""
+        callbacks = parent_callbacks.get()
+        return {
+            "callbacks": callbacks if callbacks is not None else [_create_langfuse_callback(user_info)],
+            "configurable": {"thread_id": user_info.session_id, "user_id": user_info.user_id},
+            "metadata": {"agent_name": self.name}
+        }
+
+    def _trim_history(self, config):
+        """会话消息超出数量或token上限时，删除最早的消息"""
+        state = self.agent_executor.get_state(config)
+        overflow = select_overflow_messages(state.values.get("messages", []))
+        if overflow:
+            self.agent_executor.update_state(config, {"messages": [RemoveMessage(id=m.id) for m in overflow]})
+
+    async def _atrim_history(self, config):
+        """异步删除超出上限的最早消息"""
+        state = await self.agent_executor.aget_state(config)
+        overflow = select_overflow_messages(state.values.get("messages", []))
+        if overflow:
+            await self.agent_executor.aupdate_state(config, {"messages": [RemoveMessage(id=m.id) for m in overflow]})
+
     def get_agent_info(self) -> dict:
         """获取Agent信息"""
         return {
@@ -1,26 +1,79 @@
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, List, Tuple
 from .base_agent import BaseAgent
 from utils.user_info import User
+from tools.excel_parser import iter_excel_chunks
 from tools.file_parser import create_file_parser_tool
+from tools.ocr import ocr_local
 from langchain.tools import StructuredTool
 from langchain_core.messages import SystemMessage, HumanMessage
+from knowledge_base.document_loader import DocumentLoader
 from knowledge_base.knowledge_base_manager import KnowledgeBaseManager
+from knowledge_base.manifest import hash_file, make_source_id
+from knowledge_base.reranker import RerankerService
 from knowledge_base.vector_store import VectorStoreFactory
 from prompts import KNOWLEDGE_BASE_PROMPT
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from FlagEmbedding import FlagReranker
 import math
 import os
 import logging
+import time
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
-from typing import Optional, Tuple
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def _create_text_splitter():
+    """创建知识库代理使用的文本分割器"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=300,
+        chunk_overlap=50,
+        add_start_index=True
+    )
+
+
+def _to_documents(parsed: Iterable[Dict[str, Any]]) -> List[Document]:
+    """将解析器的输出转换为文档"""
+    return [Document(page_content=item["content"], metadata=item["metadata"]) for item in parsed if item["content"]]
+
+
+def _load_directory_file(file_path: str, metadata: Dict[str, Any]) -> List[Document]:
+    """在工作进程中解析并分割目录中的单个文件，内容块带稳定的来源ID"""
+    file_type = metadata["file_type"]
+    if file_type in ("pdf", "text"):
+        documents = DocumentLoader.load_file(file_path)
+    elif file_type == "excel":
+        documents = _to_documents(iter_excel_chunks(file_path))
+    elif file_type == "image":
+        # 已在工作进程中，直接在本进程识别，不再使用共享OCR引擎的进程池
+        with open(file_path, "rb") as f:
+            text = ocr_local(f.read())
+        documents = _to_documents([{"content": text, "metadata": {"source": file_path, "type": "image"}}])
+    else:
+        raise ValueError(f"不支持的文件类型：{file_type}")
+
+    source_id = make_source_id(file_path, hash_file(file_path))
+    for doc in documents:
+        doc.metadata.update({**metadata, "source": file_path, "source_id": source_id})
+
+    # Excel 行分组已按字符数切好并各自带表头，再分割会把表头和数据行拆开
+    chunks = documents if file_type == "excel" else _create_text_splitter().split_documents(documents)
+    # 稳定的内容块ID，重复处理同一文件时覆盖而不是重复写入
+    for index, chunk in enumerate(chunks):
+        chunk.metadata["chunk_id"] = f"{source_id}-{index}"
+    return chunks
+
+
+def _parse_directory_file(file_path: str, metadata: Dict[str, Any]) -> Tuple[List[Document], float]:
+    """在工作进程中解析单个文件，返回 (内容块列表, 解析耗时秒数)"""
+    # 在工作进程内计时，不包含排队等待进程池和主进程消费的时间
+    start = time.perf_counter()
+    chunks = _load_directory_file(file_path, metadata)
+    return chunks, time.perf_counter() - start
+
+
 class KnowledgeBaseAgent(BaseAgent):
     """知识库代理，负责管理知识库内容和基于知识库回答问题"""
     
@@ -31,12 +84,9 @@ class KnowledgeBaseAgent(BaseAgent):
             kb_manager = KnowledgeBaseManager(vector_store)
         
         self.kb_manager = kb_manager
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=300,
-            chunk_overlap=50,
-            add_start_index=True
-        )
-        self.reranker = FlagReranker('BAAI/bge-reranker-v2-m3', use_fp16=True)
+        self.text_splitter = _create_text_splitter()
+        # 重排序模型在首次使用时加载，并在进程内共享
+        self.reranker = RerankerService()
         
         # 创建文件解析工具
         file_parser_tool = create_file_parser_tool(
@@ -79,17 +129,14 @@ class KnowledgeBaseAgent(BaseAgent):
         try:
             logger.info(f"开始搜索知识库，查询：{query}，分类：{category}")
             
-            # 获取初始搜索结果
-            results = self.kb_manager.search(query, category=category, top_k=top_k * 2)
+            # 获取初始搜索结果（混合检索已兼顾关键词匹配，无需成倍召回）
+            results = self.kb_manager.search(query, category=category, top_k=top_k)
             if not results:
                 logger.warning(f"未找到相关结果：{query}")
                 return "在知识库中未找到相关信息。"
             
-            # 提取文本内容
-            search_texts = [doc.page_content for doc in results]
-            
             # 重排序
-            reranked_texts = self._rerank_results(query, search_texts, top_k)
+            reranked_texts = self._rerank_results(query, results, top_k)
             
             # 构建上下文
             context = "\n\n".join(reranked_texts)
@@ -107,20 +154,14 @@ class KnowledgeBaseAgent(BaseAgent):
             logger.error(f"搜索知识库时出错: {str(e)}", exc_info=True)
             return f"搜索知识库时出错: {str(e)}"
     
-    def _rerank_results(self, query: str, search_list: List[str], k: int) -> List[str]:
+    def _rerank_results(self, query: str, documents: List[Document], k: int) -> List[str]:
         """对搜索结果进行重排序"""
         try:
-            score_text = []
-            for search in search_list:
-                score = self.reranker.compute_score([query, search])
-                score_text.append([score, search])
-            
-            sorted_data = sorted(score_text, key=lambda x: x[0], reverse=True)
-            min_k = max(min(len(sorted_data), 3), math.floor(k / 3))
-            return list(map(lambda x: x[1], sorted_data[:min_k]))
+            min_k = max(min(len(documents), 3), math.floor(k / 3))
+            return [doc.page_content for doc in self.reranker.rerank(query, documents, min_k)]
         except Exception as e:
             logger.error(f"重排序结果时出错: {str(e)}", exc_info=True)
-            return search_list[:k]  # 出错时返回原始结果
+            return [doc.page_content for doc in documents[:k]]  # 出错时返回原始结果
     
     def add_document_to_kb(self, file_path: str, category: str = None) -> str:
         """添加单个文档到知识库"""
@@ -167,65 +208,58 @@ class KnowledgeBaseAgent(BaseAgent):
                 logger.error(f"目录不存在：{directory_path}")
                 return f"目录不存在：{directory_path}"
             
-            all_text = []
-            processed_files = []
-            failed_files = []
-            
-            # 创建线程池
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                # 收集所有任务
-                future_to_path = {}
-                
-                # 遍历目录下的所有文件
-                for path in Path(directory_path).rglob('*'):
-                    if path.is_file():
-                        file_type = self._get_file_type(str(path))
-                        if file_type in ["pdf", "text", "excel", "image"]:
-                            future = executor.submit(self._process_single_file, str(path), file_type)
-                            future_to_path[future] = str(path)
-                
-                # 等待所有任务完成
-                for future in future_to_path:
-                    file_path = future_to_path[future]
-                    try:
-                        text = future.result()
-                        if text:
-                            processed_files.append(file_path)
-                            all_text.append(f"\n--- Content from {file_path} ---\n{text}\n")
-                    except Exception as e:
-                        logger.error(f"处理文件 {file_path} 时出错: {str(e)}", exc_info=True)
-                        failed_files.append((file_path, str(e)))
+            files = []
+            for path in Path(directory_path).rglob('*'):
+                if path.is_file():
+                    file_type = self._get_file_type(str(path))
+                    if file_type in ["pdf", "text", "excel", "image"]:
+                        files.append((str(path), file_type))
             
-            if not all_text:
+            if not files:
                 logger.warning(f"目录中没有可处理的文件：{directory_path}")
                 return "没有找到可处理的文件。"
             
-            # 创建文档并分割
-            documents = [Document(page_content=text) for text in all_text]
-            chunks = self.text_splitter.split_documents(documents)
-            
-            # 添加元数据
-            for chunk in chunks:
-                chunk.metadata.update({
-                    "category": category,
-                    "processed_files": processed_files
-                })
+            processed_files = []
+            failed_files = []
             
-            # 添加到向量存储
-            self.kb_manager.vector_store.add_documents(chunks)
+            # 每个文件独立成文档，内容块只携带紧凑的来源ID，解析结果分批流式写入向量存储
+            chunks = self._iter_directory_chunks(files, category, processed_files, failed_files)
+            stats = self.kb_manager.pipeline.ingest_stream(chunks)
             
             # 构建结果消息
-            result_msg = f"成功处理 {len(processed_files)} 个文件，共分割为 {len(chunks)} 个内容块。"
+            result_msg = f"成功处理 {len(processed_files)} 个文件，共分割为 {stats['chunks']} 个内容块。"
             if failed_files:
                 result_msg += f"\n处理失败的文件：{len(failed_files)} 个"
+                result_msg += "".join(f"\n- {file_path}: {error}" for file_path, error in failed_files)
             
-            logger.info(f"目录处理完成：{directory_path}")
+            parse_seconds = sum(seconds for _, seconds in processed_files)
+            slowest = max(processed_files, key=lambda item: item[1], default=None)
+            logger.info(
+                f"目录处理完成：{directory_path}，耗时 {stats['seconds']:.2f}s，"
+                f"吞吐 {stats['chunks_per_second']:.1f} chunks/s，"
+                f"解析累计耗时 {parse_seconds:.2f}s"
+                + (f"，最慢文件 {slowest[0]}（{slowest[1]:.2f}s）" if slowest else "")
+            )
             return result_msg
             
         except Exception as e:
             logger.error(f"处理目录时出错: {str(e)}", exc_info=True)
             return f"处理目录时出错: {str(e)}"
     
+    def _iter_directory_chunks(self, files, category, processed_files, failed_files):
+        """在进程池中并行解析文件，按完成顺序产出每个文件的内容块；processed_files 记录 (文件路径, 解析耗时)"""
+        base_metadata = {"category": category} if category else {}
+        files = ((file_path, {**base_metadata, "file_type": file_type}) for file_path, file_type in files)
+        for file_path, result, error in DocumentLoader.iter_load(files, loader=_parse_directory_file):
+            if error:
+                logger.error(f"处理文件 {file_path} 时出错: {str(error)}", exc_info=error)
+                failed_files.append((file_path, str(error)))
+                continue
+            chunks, seconds = result
+            logger.info(f"文件解析完成：{file_path}，{len(chunks)} 个块，解析耗时 {seconds:.2f}s")
+            processed_files.append((file_path, seconds))
+            yield from chunks
+    
     def _get_file_type(self, file_path: str) -> str:
         """获取文件类型"""
         try:
@@ -243,24 +277,6 @@ class KnowledgeBaseAgent(BaseAgent):
             logger.error(f"获取文件类型时出错: {str(e)}", exc_info=True)
             return ''
     
-    def _process_single_file(self, file_path: str, file_type: str) -> Optional[str]:
-        """处理单个文件"""
-        try:
-            logger.debug(f"开始处理文件：{file_path}，类型：{file_type}")
-            
-            if file_type == "pdf":
-                return self.kb_manager.document_loader._parse_pdf(file_path)
-            elif file_type == "text":
-                return self.kb_manager.document_loader._parse_text(file_path)
-            elif file_type == "excel":
-                return self.kb_manager.document_loader._parse_excel(file_path)
-            elif file_type == "image":
-                return self.kb_manager.document_loader._parse_image(file_path)
-            return None
-        except Exception as e:
-            logger.error(f"处理文件 {file_path} 时出错: {str(e)}", exc_info=True)
-            return None
-    
     def process_query(self, query: str, user_info: User) -> str:
         """处理用户查询"""
         try:
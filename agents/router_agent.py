@@ -1,14 +1,12 @@
 from typing import Dict, Any, List, Optional, Tuple, Union
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain.tools import Tool, StructuredTool
-from agents.base_agent import BaseAgent
+from langchain.tools import StructuredTool
+from agents.base_agent import BaseAgent, ToolCallRecorder, parent_callbacks
 from agents.agent_registry import AgentRegistry
 from prompts.router import get_router_prompt
 from utils.user_info import User
-from knowledge_base.knowledge_base_manager import KnowledgeBaseManager
-from knowledge_base.vector_store import VectorStoreFactory
-from langchain.schema import Document
 from langchain_core.callbacks import CallbackManagerForChainRun
+from langchain_core.runnables import RunnableConfig
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.prompts import ChatPromptTemplate
 
@@ -16,7 +14,7 @@ import json
 import logging
 import asyncio
 from utils import log_util
-from infrastructure.config import Config
+from infrastructure.user_memory import UserMemoryStore
 
 logger = logging.getLogger(__name__)
 
@@ -31,34 +29,65 @@ def _get_expert_list() -> str:
     return "\n".join(expert_list)
 
 
-def _route_to_expert(query: str, expert_name: str, user_info: User) -> str:
+def _get_user_from_config(config: RunnableConfig) -> User:
+    """从运行配置中取出当前用户信息"""
+    configurable = config.get("configurable", {})
+    return User(configurable.get("user_id"), configurable.get("thread_id"))
+
+
+def _with_handler(callbacks, handler):
+    """在上层回调的基础上附加一个回调处理器，不修改上层的回调管理器"""
+    if handler is None:
+        return callbacks
+    if callbacks is None:
+        return [handler]
+    if isinstance(callbacks, list):
+        return [*callbacks, handler]
+    callbacks = callbacks.copy()
+    callbacks.add_handler(handler)
+    return callbacks
+
+
+def _route_to_expert(query: str, expert_name: str, config: RunnableConfig, handler=None) -> str:
     """路由到指定的专家Agent"""
     expert_agent = AgentRegistry.get_agent(expert_name)
     if not expert_agent:
         return f"抱歉，找不到名为 {expert_name} 的专家。"
-    return expert_agent.process_query(query, user_info)
+    token = parent_callbacks.set(_with_handler(config.get("callbacks"), handler))
+    try:
+        return expert_agent.process_query(query, _get_user_from_config(config))
+    finally:
+        parent_callbacks.reset(token)
 
 
-async def _route_to_expert_async(query: str, expert_name: str, user_info: User) -> str:
+async def _route_to_expert_async(query: str, expert_name: str, config: RunnableConfig, handler=None) -> str:
     """异步路由到指定的专家Agent"""
     expert_agent = AgentRegistry.get_agent(expert_name)
     if not expert_agent:
         return f"抱歉，找不到名为 {expert_name} 的专家。"
-    return await expert_agent.aprocess_query(query, user_info)
+    token = parent_callbacks.set(_with_handler(config.get("callbacks"), handler))
+    try:
+        return await expert_agent.aprocess_query(query, _get_user_from_config(config))
+    finally:
+        parent_callbacks.reset(token)
 
 
 class RouterAgent(BaseAgent):
     """路由Agent，负责处理用户对话，并在需要时调用专家Agent"""
 
-    def __init__(self, llm):
-        # 初始化知识库
-        self.vector_store = VectorStoreFactory.create_vector_store()
-        self.kb_manager = KnowledgeBaseManager(self.vector_store)
+    def __init__(self, llm, knowledge_base=None, expert_cache=None):
+        # 初始化用户记忆存储
+        self.user_memory = UserMemoryStore()
+        if knowledge_base is not None:
+            self._migrate_user_memory(knowledge_base)
+        # 专家回答缓存，在转给专家的环节按专家和问题缓存
+        self.expert_cache = expert_cache
         
-        # 创建路由工具
-        route_tool = Tool(
+        # 创建路由工具，异步调用时全程使用协程，不阻塞事件循环
+        route_tool = StructuredTool.from_function(
+            func=self.consult_expert,
+            coroutine=self.consult_expert_async,
             name="consult_expert",
-            func=_route_to_expert,
             description=f"""当需要专业知识时，可以使用此工具咨询专家。
             
             可用的专家列表：
@@ -67,7 +96,6 @@ class RouterAgent(BaseAgent):
             参数：
             - query: 要咨询的具体问题
             - expert_name: 要咨询的专家名称（必须从上面的列表中选择）
-            - user_info: 用户信息对象
             
             返回：专家的回答
             
@@ -80,7 +108,8 @@ class RouterAgent(BaseAgent):
         
         # 创建记忆信息工具
         remember_tool = StructuredTool.from_function(
-            func=self.remember_user_info_async,
+            func=self.remember_user_info,
+            coroutine=self.remember_user_info_async,
             name="remember_info",
             description="""用于记住用户提供的重要信息，稍后可以在对话中使用。
             
@@ -132,23 +161,63 @@ class RouterAgent(BaseAgent):
             logger.error(f"异步处理查询时出错: {str(e)}", exc_info=True)
             return f"处理请求时出错: {str(e)}"
 
+    async def astream_query(self, query: str, user_info: User):
+        """异步处理用户查询，以事件流的形式产出路由和专家Agent的输出"""
+        user_memory = await self._aget_user_memory(user_info.user_id)
+        messages = self._create_messages(query, user_memory, user_info)
+        async for event in self.astream_events(messages, user_info):
+            yield event
+
+    def consult_expert(self, query: str, expert_name: str, config: RunnableConfig) -> str:
+        """咨询专家，与用户无关的专家回答按问题缓存"""
+        if self.expert_cache is None:
+            return _route_to_expert(query, expert_name, config)
+        answer = self.expert_cache.lookup(expert_name, query)
+        if answer is not None:
+            return answer
+
+        recorder = ToolCallRecorder()
+        answer = _route_to_expert(query, expert_name, config, recorder)
+        user_id = config.get("configurable", {}).get("user_id")
+        self.expert_cache.store(
+            expert_name, query, answer,
+            tool_names=[name for name, _ in recorder.calls],
+            has_user_memory=bool(self.user_memory.get(user_id))
+        )
+        return answer
+
+    async def consult_expert_async(self, query: str, expert_name: str, config: RunnableConfig) -> str:
+        """异步咨询专家，与用户无关的专家回答按问题缓存"""
+        if self.expert_cache is None:
+            return await _route_to_expert_async(query, expert_name, config)
+        # 缓存查找可能需要计算问题向量，放到线程中执行
+        answer = await asyncio.to_thread(self.expert_cache.lookup, expert_name, query)
+        if answer is not None:
+            return answer
+
+        recorder = ToolCallRecorder()
+        answer = await _route_to_expert_async(query, expert_name, config, recorder)
+        user_id = config.get("configurable", {}).get("user_id")
+        memories = await asyncio.to_thread(self.user_memory.get, user_id)
+        await asyncio.to_thread(
+            self.expert_cache.store, expert_name, query, answer,
+            [name for name, _ in recorder.calls], bool(memories)
+        )
+        return answer
+
+    def _migrate_user_memory(self, knowledge_base):
+        """一次性迁移旧版保存在向量存储中的用户记忆，失败时不影响启动，下次启动重试"""
+        try:
+            count = self.user_memory.migrate_from_vector_store(knowledge_base)
+            if count:
+                logger.info(f"已将 {count} 条用户记忆从向量存储迁移到用户记忆存储")
+        except Exception as e:
+            logger.error(f"迁移用户记忆时出错: {str(e)}", exc_info=True)
+
     def remember_user_info(self, info: str, user_id: str, info_type: str = "general") -> str:
         """记住用户提供的信息"""
         try:
-            # 创建一个包含用户信息的文档
-            metadata = {
-                "user_id": user_id,
-                "info_type": info_type,
-                "category": "user_memory"
-            }
-            
-            memory_doc = Document(
-                page_content=info,
-                metadata=metadata
-            )
-            
-            # 添加到向量存储
-            self.vector_store.add_documents([memory_doc])
+            self.user_memory.add(user_id, info, info_type)
             
             logger.info(f"已记住用户 {user_id} 的信息：类型 - {info_type}, 内容 - {info[:30]}...")
             return f"我已记住这条信息：{info}"
@@ -172,25 +241,7 @@ class RouterAgent(BaseAgent):
     def _get_user_memory(self, user_id: str) -> str:
         """获取用户的历史记忆信息"""
         try:
-            # 获取存储类型
-            store_type = Config.VECTOR_STORE_TYPE
-            results = None
-            
-            if store_type == "chroma":
-                # Chroma使用的过滤器格式
-                filter_dict = {"metadata": {"$and": [
-                    {"user_id": {"$eq": user_id}},
-                    {"category": {"$eq": "user_memory"}}
-                ]}}
-                results = self.vector_store.search(
-                    "用户信息", filter=filter_dict, top_k=10
-                )
-            else:
-                # FAISS和其他向量存储的过滤器格式
-                filter_dict = {"user_id": user_id, "category": "user_memory"}
-                results = self.vector_store.search(
-                    "用户信息", filter=filter_dict, top_k=10
-                )
+            results = self.user_memory.get(user_id)
             
             if not results:
                 logger.info(f"未找到用户 {user_id} 的记忆信息")
@@ -198,9 +249,8 @@ class RouterAgent(BaseAgent):
             
             # 整合所有记忆信息
             memories = []
-            for doc in results:
-                info_type = doc.metadata.get("info_type", "general")
-                memories.append(f"- {info_type}: {doc.page_content}")
+            for info_type, content in results:
+                memories.append(f"- {info_type}: {content}")
             
             memory_text = "\n".join(memories)
             logger.info(f"获取到用户 {user_id} 的记忆信息: {len(memories)} 条")
@@ -8,6 +8,8 @@ from agents.file_parser_agent import FileParserAgent
 from agents.customer_service_agent import CustomerServiceAgent
 from infrastructure.config import Config
 from infrastructure.models import ModelProvider
+from infrastructure.semantic_cache import ExpertAnswerCache, SemanticCache
+from knowledge_base.knowledge_base_manager import KnowledgeBaseManager
 from knowledge_base.vector_store import VectorStoreFactory
 from utils.log_util import log_exception
 from utils.user_info import User
@@ -24,7 +26,7 @@ class AgentSystem:
         self.langfuse_config = langfuse_config or {}
 
         # 初始化组件
-        self.knowledge_base = VectorStoreFactory.create_vector_store("chroma")
+        self.knowledge_base = VectorStoreFactory.create_vector_store()
 
         # 清空之前的Agent注册表
         AgentRegistry.clear()
@@ -52,7 +54,7 @@ class AgentSystem:
             # 创建知识库代理
             KnowledgeBaseAgent(
                 llm=common_llm,
-                kb_manager=None  # 使用默认的知识库管理器
+                kb_manager=KnowledgeBaseManager(self.knowledge_base)
             ),
 
             ProductExpertAgent(
@@ -78,13 +80,22 @@ class AgentSystem:
 
             # 使用本地微调的模型，创建路由Agent
             RouterAgent(
-                llm=self._init_llm(Config.CHAT_MODEL_TYPE, Config.CHAT_MODEL_NAME)
+                llm=self._init_llm(Config.CHAT_MODEL_TYPE, Config.CHAT_MODEL_NAME),
+                knowledge_base=self.knowledge_base,
+                expert_cache=self._create_expert_cache()
             )
         ]
 
         for agent in list:
             AgentRegistry.register_agent(agent.name, agent)
 
+    def _create_expert_cache(self):
+        """创建专家回答缓存，知识库有写入或删除时自动失效"""
+        if not Config.SEMANTIC_CACHE_ENABLED:
+            return None
+        knowledge_base = self.knowledge_base
+        return ExpertAnswerCache(SemanticCache(knowledge_base.embedding, version_func=lambda: knowledge_base.version))
+
     async def process_query(self, query, user_id, session_id):
         """处理用户查询"""
 
@@ -101,3 +112,12 @@ class AgentSystem:
         except Exception as e:
             log_exception(e)
             raise
+
+    async def astream_query(self, query, user_id, session_id):
+        """以事件流的形式处理用户查询"""
+        router_agent = AgentRegistry.get_agent("router_agent")
+        if not router_agent:
+            raise Exception("Router agent not found")
+
+        async for event in router_agent.astream_query(query, User(user_id, session_id)):
+            yield event
@@ -0,0 +1,204 @@
+# infrastructure/checkpointer.py
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from infrastructure.config import Config
+
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ImportError:
+    SqliteSaver = None
+
+
+class BoundedMemorySaver(MemorySaver):
+    """有界内存检查点：按LRU/TTL淘汰空闲会话，每个会话只保留最近的检查点"""
+
+    def __init__(self, max_threads=None, ttl=None, max_checkpoints=None):
+        super().__init__()
+        self.max_threads = max_threads or Config.CHECKPOINT_MAX_THREADS
+        self.ttl = Config.CHECKPOINT_THREAD_TTL if ttl is None else ttl
+        self.max_checkpoints = max_checkpoints or Config.CHECKPOINT_MAX_HISTORY
+        self._last_access = OrderedDict()
+        self._bound_lock = threading.RLock()
+
+    def get_tuple(self, config):
+        self._touch(config)
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        self._touch(config)
+        with self._bound_lock:
+            self._prune_history(config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", ""))
+        return result
+
+    def _touch(self, config):
+        """记录会话访问时间，并淘汰超出容量或已过期的会话"""
+        thread_id = config["configurable"]["thread_id"]
+        now = time.monotonic()
+        with self._bound_lock:
+            self._last_access[thread_id] = now
+            self._last_access.move_to_end(thread_id)
+
+            while len(self._last_access) > self.max_threads:
+                expired_id, _ = self._last_access.popitem(last=False)
+                self._drop_thread(expired_id)
+
+            while self.ttl and self._last_access:
+                oldest_id, last_access = next(iter(self._last_access.items()))
+                if now - last_access <= self.ttl:
+                    break
+                self._last_access.popitem(last=False)
+                self._drop_thread(oldest_id)
+
+    def _drop_thread(self, thread_id):
+        """删除会话的全部检查点数据"""
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            del self.writes[key]
+        blobs = getattr(self, "blobs", None)
+        if blobs is not None:
+            for key in [key for key in blobs if key[0] == thread_id]:
+                del blobs[key]
+
+    def _prune_history(self, thread_id, checkpoint_ns):
+        """只保留最近的 max_checkpoints 个检查点，并删除不再被引用的通道数据"""
+        checkpoints = self.storage.get(thread_id, {}).get(checkpoint_ns)
+        if not checkpoints or len(checkpoints) <= self.max_checkpoints:
+            return
+
+        expired_ids = sorted(checkpoints)[:-self.max_checkpoints]
+        expired = [checkpoints.pop(checkpoint_id) for checkpoint_id in expired_ids]
+        for checkpoint_id in expired_ids:
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        blobs = getattr(self, "blobs", None)
+        if blobs is None:
+            return
+        referenced = set()
+        for saved in checkpoints.values():
+            referenced.update(self._channel_versions(saved))
+        for saved in expired:
+            for channel, version in self._channel_versions(saved) - referenced:
+                blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+
+    def _channel_versions(self, saved):
+        try:
+            checkpoint = self.serde.loads_typed(saved[0])
+        except Exception:
+            # 旧版本的存储格式不同，无法解析时不清理通道数据
+            return set()
+        return set(checkpoint.get("channel_versions", {}).items())
+
+
+if SqliteSaver is not None:
+    class ThreadedSqliteSaver(SqliteSaver):
+        """有界SQLite持久化检查点：淘汰空闲会话，每个会话只保留最近的检查点；异步接口在线程中调用同步实现"""
+
+        def __init__(self, conn, max_threads=None, ttl=None, max_checkpoints=None, **kwargs):
+            super().__init__(conn, **kwargs)
+            self.max_threads = max_threads or Config.CHECKPOINT_MAX_THREADS
+            self.ttl = Config.CHECKPOINT_THREAD_TTL if ttl is None else ttl
+            self.max_checkpoints = max_checkpoints or Config.CHECKPOINT_MAX_HISTORY
+
+        def setup(self):
+            if self.is_setup:
+                return
+            super().setup()
+            # 会话最后写入时间保存在同一数据库中，重启后仍能按TTL/LRU淘汰；已有会话从启动时开始计时
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_access (thread_id TEXT PRIMARY KEY, last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_thread_access_time ON thread_access (last_access)")
+            self.conn.execute(
+                "INSERT OR IGNORE INTO thread_access (thread_id, last_access) "
+                "SELECT DISTINCT thread_id, ? FROM checkpoints",
+                (time.time(),)
+            )
+            self.conn.commit()
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            result = super().put(config, checkpoint, metadata, new_versions)
+            self._enforce_bounds(str(config["configurable"]["thread_id"]), config["configurable"].get("checkpoint_ns", ""))
+            return result
+
+        def _enforce_bounds(self, thread_id, checkpoint_ns):
+            """记录会话写入时间，裁剪该会话的历史检查点，并淘汰超出容量或已过期的会话"""
+            now = time.time()
+            with self.cursor() as cur:
+                cur.execute(
+                    "INSERT OR REPLACE INTO thread_access (thread_id, last_access) VALUES (?, ?)", (thread_id, now)
+                )
+
+                # checkpoint_id 随时间递增，保留最新的 max_checkpoints 个，并删除已删除检查点的中间写入
+                cur.execute(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+                    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT ?)",
+                    (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.max_checkpoints)
+                )
+                if cur.rowcount:
+                    cur.execute(
+                        "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+                        "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)",
+                        (thread_id, checkpoint_ns, thread_id, checkpoint_ns)
+                    )
+
+                expired = cur.execute(
+                    "SELECT thread_id FROM thread_access WHERE last_access < ? "
+                    "UNION SELECT thread_id FROM ("
+                    "SELECT thread_id FROM thread_access ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (now - self.ttl if self.ttl else float("-inf"), self.max_threads)
+                ).fetchall()
+                for table in ("checkpoints", "writes", "thread_access"):
+                    cur.executemany(f"DELETE FROM {table} WHERE thread_id = ?", expired)
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, **kwargs):
+            for item in await asyncio.to_thread(lambda: list(self.list(config, **kwargs))):
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, *args, **kwargs)
+
+
+def create_checkpointer(name):
+    """按配置为指定Agent创建检查点存储"""
+    if Config.CHECKPOINTER_TYPE == "sqlite":
+        if SqliteSaver is None:
+            raise ImportError("使用SQLite检查点需要安装 langgraph-checkpoint-sqlite")
+        os.makedirs(Config.CHECKPOINTER_PATH, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(Config.CHECKPOINTER_PATH, f"{name}.db"), check_same_thread=False)
+        return ThreadedSqliteSaver(conn)
+    return BoundedMemorySaver()
+
+
+def select_overflow_messages(messages, max_messages=None, max_tokens=None):
+    """选出超出会话消息数或token上限、需要删除的最早消息"""
+    max_messages = max_messages or Config.CHECKPOINT_MAX_MESSAGES
+    max_tokens = max_tokens or Config.CHECKPOINT_MAX_TOKENS
+
+    # 粗略估算token数：中文约一字一token
+    sizes = [len(str(message.content)) for message in messages]
+    cut = max(0, len(messages) - max_messages)
+    total = sum(sizes[cut:])
+    while cut < len(messages) and total > max_tokens:
+        total -= sizes[cut]
+        cut += 1
+
+    # 保留部分从一条用户或系统消息开始，避免留下缺少调用方的工具消息
+    while 0 < cut < len(messages) and not isinstance(messages[cut], (HumanMessage, SystemMessage)):
+        cut += 1
+    return messages[:cut]
@@ -14,6 +14,16 @@ class Config:
     MODEL_TYPE = os.getenv("MODEL_TYPE", "openai")  # openai 或 local
     MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
 
+    # 模型接口HTTP连接池配置（每个接口地址共享一个连接池）
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+    LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30"))  # 秒
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"  # 需要安装 h2，未安装时退回 HTTP/1.1
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # 秒
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))  # 秒
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # 接口返回可重试错误时的重试次数
+    LLM_CONNECT_RETRIES = int(os.getenv("LLM_CONNECT_RETRIES", "1"))  # 建立连接失败时的重试次数
+
     # 对话模型
     CHAT_MODEL_TYPE = os.getenv("CHAT_MODEL_TYPE")
     CHAT_MODEL_NAME = os.getenv("CHAT_MODEL_NAME")
@@ -25,9 +35,101 @@ class Config:
     # 向量存储配置
     VECTOR_STORE_TYPE = os.getenv("VECTOR_STORE_TYPE", "chroma")
     VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./vector_store")
+    VECTOR_STORE_WRITE_BEHIND = os.getenv("VECTOR_STORE_WRITE_BEHIND", "true").lower() == "true"
+    VECTOR_STORE_FLUSH_INTERVAL = float(os.getenv("VECTOR_STORE_FLUSH_INTERVAL", "5"))  # 秒
+    VECTOR_STORE_FLUSH_THRESHOLD = int(os.getenv("VECTOR_STORE_FLUSH_THRESHOLD", "500"))  # 文档数
+
+    # 向量缓存配置
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(VECTOR_STORE_PATH, "embedding_cache.db"))
+
+    # 嵌入流水线配置
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "25"))
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    EMBEDDING_RATE_LIMIT = float(os.getenv("EMBEDDING_RATE_LIMIT", "10"))  # 每秒请求数
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+
+    # 对话历史数据库配置
+    CONVERSATION_DB_POOL_SIZE = int(os.getenv("CONVERSATION_DB_POOL_SIZE", "4"))
+    CONVERSATION_DB_BATCH_SIZE = int(os.getenv("CONVERSATION_DB_BATCH_SIZE", "100"))
+    CONVERSATION_DB_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_DB_FLUSH_INTERVAL", "0.05"))  # 秒
+    CONVERSATION_RETENTION_DAYS = int(os.getenv("CONVERSATION_RETENTION_DAYS", "30"))  # 0 表示不归档
+    CONVERSATION_ARCHIVE_INTERVAL = float(os.getenv("CONVERSATION_ARCHIVE_INTERVAL", "3600"))  # 秒
+
+    # Agent检查点配置
+    CHECKPOINTER_TYPE = os.getenv("CHECKPOINTER_TYPE", "memory")  # memory 或 sqlite
+    CHECKPOINTER_PATH = os.getenv("CHECKPOINTER_PATH", "./checkpoints")
+    CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+    CHECKPOINT_THREAD_TTL = float(os.getenv("CHECKPOINT_THREAD_TTL", "3600"))  # 秒，0 表示不过期
+    CHECKPOINT_MAX_HISTORY = int(os.getenv("CHECKPOINT_MAX_HISTORY", "5"))  # 每个会话保留的检查点数
+    CHECKPOINT_MAX_MESSAGES = int(os.getenv("CHECKPOINT_MAX_MESSAGES", "40"))
+    CHECKPOINT_MAX_TOKENS = int(os.getenv("CHECKPOINT_MAX_TOKENS", "8000"))
+
+    # 重排序配置
+    RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3")
+    RERANKER_USE_FP16 = os.getenv("RERANKER_USE_FP16", "true").lower() == "true"
+    RERANKER_SOCKET = os.getenv("RERANKER_SOCKET")  # 设置后通过本地socket使用独立的重排序进程
+    RERANKER_AUTHKEY = os.getenv("RERANKER_AUTHKEY")  # 重排序进程的连接认证密钥，使用 RERANKER_SOCKET 时必须设置
+    RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))  # 每对 (查询, 段落) 的最大token数
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+    RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+    RERANK_LATENCY_BUDGET = float(os.getenv("RERANK_LATENCY_BUDGET", "1.0"))  # 秒，0 表示不限制
+
+    # 用户记忆配置
+    USER_MEMORY_DB_PATH = os.getenv("USER_MEMORY_DB_PATH", "user_memory.db")
+    USER_MEMORY_CACHE_SIZE = int(os.getenv("USER_MEMORY_CACHE_SIZE", "1000"))  # 缓存的用户数
+    USER_MEMORY_MAX_PER_USER = int(os.getenv("USER_MEMORY_MAX_PER_USER", "50"))
+
+    # 语义回答缓存配置
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # 余弦相似度
+    SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))  # 秒，0 表示不过期
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))  # 每个作用域的条目数
+    # 回答与用户无关、可跨用户缓存的专家，以路由Agent转给专家的问题为键
+    SEMANTIC_CACHE_SHARED_EXPERTS = [
+        name.strip() for name in os.getenv("SEMANTIC_CACHE_SHARED_EXPERTS", "product_expert,knowledge_base_agent").split(",")
+        if name.strip()
+    ]
+    # 有副作用的工具，专家调用过这些工具时回答不缓存
+    SEMANTIC_CACHE_SKIP_TOOLS = [
+        name.strip() for name in os.getenv(
+            "SEMANTIC_CACHE_SKIP_TOOLS",
+            "parse_file,parse_document,add_document,process_directory,ticket_creator"
+        ).split(",")
+        if name.strip()
+    ]
+
+    # 文件上传与后台任务配置
+    UPLOAD_DIR = os.getenv("UPLOAD_DIR")  # 上传文件的临时目录，默认使用系统临时目录
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # 字节
+    JOB_MAX_CONCURRENCY = int(os.getenv("JOB_MAX_CONCURRENCY", "2"))  # 同时解析的文件数
+    JOB_TTL = float(os.getenv("JOB_TTL", "3600"))  # 秒，已结束任务的状态保留时间
+
+    # OCR配置
+    OCR_LANG = os.getenv("OCR_LANG", "chi_sim+eng")
+    OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "")  # 额外的Tesseract参数，如 --psm 6
+    OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(os.cpu_count() or 4)))
+    OCR_MAX_WIDTH = int(os.getenv("OCR_MAX_WIDTH", "2000"))  # 像素，更宽的图片先缩小
+    OCR_TILE_HEIGHT = int(os.getenv("OCR_TILE_HEIGHT", "1600"))  # 像素，长图按此高度切分并行识别
+    OCR_BINARIZE = os.getenv("OCR_BINARIZE", "true").lower() == "true"
+    OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "1000"))
+
+    # PDF解析配置
+    PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", str(os.cpu_count() or 4)))
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "20"))  # 每个工作进程一次处理的页数
+    PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "20"))  # 文本少于该字符数的页面视为扫描页
+    PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "200"))  # 扫描页渲染为图片的分辨率
+
+    # Excel解析配置
+    EXCEL_ROWS_PER_CHUNK = int(os.getenv("EXCEL_ROWS_PER_CHUNK", "50"))
+    EXCEL_MAX_CHUNK_CHARS = int(os.getenv("EXCEL_MAX_CHUNK_CHARS", "2000"))  # 每个分组（不含表头）的最大字符数
+    EXCEL_MAX_ROWS_PER_SHEET = int(os.getenv("EXCEL_MAX_ROWS_PER_SHEET", "200000"))  # 0 表示不限制
 
     # 知识库配置
     KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH", "./knowledge_base")
+    RRF_K = int(os.getenv("RRF_K", "60"))  # 混合检索倒数排名融合的平滑常数
+    LOADER_MAX_WORKERS = int(os.getenv("LOADER_MAX_WORKERS", str(os.cpu_count() or 4)))  # 文档解析进程数
 
     # Langfuse配置
     LANGFUSE_PUBLIC_KEY = os.getenv("LANGFUSE_PUBLIC_KEY")
@@ -1,48 +1,266 @@
 # infrastructure/database.py
-import sqlite3
+import asyncio
 import json
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from infrastructure.config import Config
+from utils.log_util import log_exception, logger
+
+
+class InvalidCursorError(ValueError):
+    """分页游标格式错误"""
+
+
+def parse_cursor(cursor):
+    """解析 "created_at:id" 格式的分页游标"""
+    parts = cursor.split(":")
+    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+        raise InvalidCursorError(f"无效的分页游标: {cursor}")
+    return int(parts[0]), int(parts[1])
+
 
 class ConversationDB:
-    """对话历史数据库"""
+    """对话历史数据库，写入由后台任务批量提交，读取使用连接池"""
+
+    def __init__(self, db_path="conversations.db", pool_size=None, batch_size=None, flush_interval=None):
+        self.db_path = db_path
+        self.pool_size = pool_size or Config.CONVERSATION_DB_POOL_SIZE
+        self.batch_size = batch_size or Config.CONVERSATION_DB_BATCH_SIZE
+        self.flush_interval = Config.CONVERSATION_DB_FLUSH_INTERVAL if flush_interval is None else flush_interval
 
-    def __init__(self, db_path="conversations.db"):
-        self.conn = sqlite3.connect(db_path)
+        self.conn = self._connect()
         self.create_tables()
 
+        self._read_pool = queue.Queue()
+        for _ in range(self.pool_size):
+            self._read_pool.put(self._connect())
+
+        # 写入固定在单个线程中执行，读取使用独立的线程池
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-writer")
+        self._read_executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="conversation-reader")
+        self._queue = None
+        self._writer_task = None
+
+    def _connect(self):
+        """创建WAL模式的连接"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
     def create_tables(self):
-        """创建必要的表"""
+        """创建必要的表，并执行结构迁移"""
         cursor = self.conn.cursor()
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY,
-            session_id TEXT,
-            user_query TEXT,
-            response TEXT,
-            timestamp TEXT,
-            metadata TEXT
-        )
-        ''')
+        # 对话id使用 AUTOINCREMENT，归档后删除的id不会被新记录复用，归档表沿用原id
+        cursor.execute(self._table_sql("conversations", "INTEGER PRIMARY KEY AUTOINCREMENT"))
+        cursor.execute(self._table_sql("conversations_archive", "INTEGER PRIMARY KEY"))
         self.conn.commit()
+        self._migrate()
 
-    def save_conversation(self, session_id, user_query, response, metadata=None):
-        """保存对话记录"""
-        cursor = self.conn.cursor()
-        timestamp = datetime.now().isoformat()
+    @staticmethod
+    def _table_sql(table, id_type, if_not_exists=True):
+        return f'''
+            CREATE TABLE {"IF NOT EXISTS " if if_not_exists else ""}{table} (
+                id {id_type},
+                session_id TEXT,
+                user_query TEXT,
+                response TEXT,
+                timestamp TEXT,
+                metadata TEXT,
+                created_at INTEGER
+            )
+            '''
+
+    def _migrate(self):
+        """按 user_version 依次执行结构迁移"""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # 增加整数时间戳（毫秒）列并回填，建立 (session_id, created_at) 复合索引
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(conversations)")]
+            with self.conn:
+                if "created_at" not in columns:
+                    self.conn.execute("ALTER TABLE conversations ADD COLUMN created_at INTEGER")
+                rows = self.conn.execute(
+                    "SELECT id, timestamp FROM conversations WHERE created_at IS NULL"
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE conversations SET created_at = ? WHERE id = ?",
+                    [(self._to_epoch_ms(timestamp), row_id) for row_id, timestamp in rows]
+                )
+                self.conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_conversations_session_created "
+                    "ON conversations (session_id, created_at, id)"
+                )
+                self.conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_conversations_archive_session "
+                    "ON conversations_archive (session_id, created_at, id)"
+                )
+                self.conn.execute("PRAGMA user_version = 1")
+
+        if version < 2:
+            # 旧表的id是普通rowid，最大id的记录被归档删除后会被复用，再次归档时与归档表主键冲突；
+            # 重建为 AUTOINCREMENT 表，并把序列起点设为两张表中的最大id
+            table_sql = self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'conversations'"
+            ).fetchone()[0]
+            with self.conn:
+                if "AUTOINCREMENT" not in table_sql.upper():
+                    columns = "id, session_id, user_query, response, timestamp, metadata, created_at"
+                    self.conn.execute(self._table_sql(
+                        "conversations_new", "INTEGER PRIMARY KEY AUTOINCREMENT", if_not_exists=False
+                    ))
+                    self.conn.execute(
+                        f"INSERT INTO conversations_new ({columns}) SELECT {columns} FROM conversations"
+                    )
+                    self.conn.execute("DROP TABLE conversations")
+                    self.conn.execute("ALTER TABLE conversations_new RENAME TO conversations")
+                    self.conn.execute(
+                        "CREATE INDEX IF NOT EXISTS idx_conversations_session_created "
+                        "ON conversations (session_id, created_at, id)"
+                    )
+                max_id = self.conn.execute(
+                    "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM conversations "
+                    "UNION ALL SELECT MAX(id) FROM conversations_archive)"
+                ).fetchone()[0] or 0
+                self.conn.execute("DELETE FROM sqlite_sequence WHERE name = 'conversations'")
+                self.conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('conversations', ?)", (max_id,))
+                self.conn.execute("PRAGMA user_version = 2")
+
+    @staticmethod
+    def _to_epoch_ms(timestamp):
+        try:
+            return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+        except (TypeError, ValueError):
+            return 0
+
+    async def save_conversation(self, session_id, user_query, response, metadata=None):
+        """保存对话记录，放入写队列后立即返回"""
+        self._ensure_writer()
+        now = datetime.now()
         metadata_json = json.dumps(metadata) if metadata else "{}"
+        await self._queue.put((
+            session_id, user_query, response, now.isoformat(), metadata_json, int(now.timestamp() * 1000)
+        ))
 
-        cursor.execute(
-            "INSERT INTO conversations (session_id, user_query, response, timestamp, metadata) VALUES (?, ?, ?, ?, ?)",
-            (session_id, user_query, response, timestamp, metadata_json)
+    async def get_conversation_history(self, session_id, limit=10, cursor=None):
+        """按时间倒序分页获取会话历史，返回 (记录列表, 下一页游标)；游标格式错误时抛出 InvalidCursorError"""
+        position = parse_cursor(cursor) if cursor else None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._read_executor, self._read_history, session_id, limit, position
         )
-        self.conn.commit()
 
-    def get_conversation_history(self, session_id, limit=10):
-        """获取特定会话的历史记录"""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT user_query, response, timestamp FROM conversations WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?",
-            (session_id, limit)
-        )
-        return cursor.fetchall()
+    async def archive_old_sessions(self, retention_days):
+        """将最后活跃时间早于保留期的会话移入归档表，返回归档的记录数"""
+        cutoff = int((time.time() - retention_days * 86400) * 1000)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._archive_sessions, cutoff)
+
+    async def run_retention(self, retention_days, interval):
+        """周期性归档过期会话，interval 单位为秒"""
+        while True:
+            try:
+                archived = await self.archive_old_sessions(retention_days)
+                if archived:
+                    logger.info(f"已归档 {archived} 条过期对话记录")
+            except Exception as e:
+                log_exception(e, "归档过期会话失败")
+            await asyncio.sleep(interval)
+
+    async def flush(self):
+        """等待写队列中的记录全部提交"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        """提交剩余记录并释放连接"""
+        await self.flush()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        while not self._read_pool.empty():
+            self._read_pool.get_nowait().close()
+        self.conn.close()
+
+    def _ensure_writer(self):
+        """在当前事件循环中启动后台写入任务"""
+        if self._writer_task is None or self._writer_task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.batch_size * 100)
+            self._writer_task = asyncio.get_running_loop().create_task(self._writer_loop())
+
+    async def _writer_loop(self):
+        """从队列中收集记录，按批次在一个事务中提交"""
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await loop.run_in_executor(self._write_executor, self._write_batch, rows)
+            except Exception as e:
+                log_exception(e, f"批量保存 {len(rows)} 条对话记录失败")
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+    def _write_batch(self, rows):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO conversations (session_id, user_query, response, timestamp, metadata, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def _read_history(self, session_id, limit, position):
+        conn = self._read_pool.get()
+        try:
+            if position:
+                created_at, row_id = position
+                rows = conn.execute(
+                    "SELECT id, user_query, response, timestamp, created_at FROM conversations "
+                    "WHERE session_id = ? AND (created_at, id) < (?, ?) "
+                    "ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (session_id, created_at, row_id, limit + 1)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT id, user_query, response, timestamp, created_at FROM conversations "
+                    "WHERE session_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                    (session_id, limit + 1)
+                ).fetchall()
+        finally:
+            self._read_pool.put(conn)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1][4]}:{rows[-1][0]}"
+        return [(user_query, response, timestamp) for _, user_query, response, timestamp, _ in rows], next_cursor
+
+    def _archive_sessions(self, cutoff):
+        columns = "id, session_id, user_query, response, timestamp, metadata, created_at"
+        expired = "SELECT session_id FROM conversations GROUP BY session_id HAVING MAX(created_at) < ?"
+        with self.conn:
+            self.conn.execute(
+                f"INSERT INTO conversations_archive ({columns}) "
+                f"SELECT {columns} FROM conversations WHERE session_id IN ({expired})",
+                (cutoff,)
+            )
+            return self.conn.execute(
+                f"DELETE FROM conversations WHERE session_id IN ({expired})", (cutoff,)
+            ).rowcount
@@ -0,0 +1,129 @@
+# infrastructure/embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """带缓存的嵌入模型，内存LRU在前，SQLite持久化在后"""
+
+    def __init__(self, embedding: Embeddings, model_name: str, cache_path: Optional[str] = None,
+                 max_size: int = 10000):
+        self.embedding = embedding
+        self.model_name = model_name
+        self.max_size = max_size
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量获取文档向量，只对未缓存的文本调用嵌入接口"""
+        return self._embed(texts, "document", self.embedding.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        """获取查询向量"""
+        return self._embed([text], "query", lambda t: [self.embedding.embed_query(t[0])])[0]
+
+    def get_stats(self) -> Dict[str, float]:
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+                "memory_size": len(self._memory)
+            }
+
+    def _key(self, text: str, kind: str) -> str:
+        """缓存键：模型名 + 向量类型 + 文本哈希"""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{kind}:{digest}"
+
+    def _embed(self, texts, kind, embed_func):
+        keys = [self._key(text, kind) for text in texts]
+        results = [None] * len(texts)
+        missing = OrderedDict()
+
+        # 内存LRU
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+        # 磁盘缓存
+        if missing and self._conn is not None:
+            for key, vector in self._load_from_disk(list(missing)).items():
+                for i in missing.pop(key):
+                    results[i] = vector
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+
+        # 调用嵌入接口
+        if missing:
+            miss_keys = list(missing)
+            vectors = embed_func([texts[missing[key][0]] for key in miss_keys])
+            with self._lock:
+                self.misses += len(miss_keys)
+                for key, vector in zip(miss_keys, vectors):
+                    self._remember(key, vector)
+            self._save_to_disk(zip(miss_keys, vectors))
+            for key, vector in zip(miss_keys, vectors):
+                for i in missing[key]:
+                    results[i] = vector
+
+        return results
+
+    def _remember(self, key, vector):
+        """写入内存LRU，超出容量时淘汰最久未使用的向量，调用方需持有锁"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _load_from_disk(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def _save_to_disk(self, items):
+        if self._conn is None:
+            return
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
@@ -1,22 +1,63 @@
 # infrastructure/embeddings.py
+import threading
+
 from langchain_community.embeddings import DashScopeEmbeddings
 from langchain_openai import OpenAIEmbeddings
 
 from infrastructure.config import Config
+from infrastructure.embedding_cache import CachedEmbeddings
 
 
 class EmbeddingProvider:
     """嵌入模型提供者"""
 
+    # 进程内共享的嵌入模型客户端，避免每个向量存储各自创建
+    _instances = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_or_create(cls, key, factory):
+        """按键获取共享实例，不存在时创建"""
+        with cls._lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls._with_cache(factory())
+                cls._instances[key] = instance
+            return instance
+
     @staticmethod
-    def get_openai_embeddings():
+    def _with_cache(embedding):
+        """按配置为嵌入模型加上缓存"""
+        if not Config.EMBEDDING_CACHE_ENABLED:
+            return embedding
+        model_name = getattr(embedding, "model", None) or type(embedding).__name__
+        return CachedEmbeddings(
+            embedding,
+            model_name=model_name,
+            cache_path=Config.EMBEDDING_CACHE_PATH,
+            max_size=Config.EMBEDDING_CACHE_SIZE
+        )
+
+    @classmethod
+    def get_cache_stats(cls):
+        """获取所有嵌入模型的缓存命中统计"""
+        with cls._lock:
+            instances = list(cls._instances.items())
+        return {
+            key: instance.get_stats()
+            for key, instance in instances
+            if isinstance(instance, CachedEmbeddings)
+        }
+
+    @classmethod
+    def get_openai_embeddings(cls):
         """获取OpenAI嵌入模型"""
-        return OpenAIEmbeddings()
+        return cls._get_or_create("openai", OpenAIEmbeddings)
 
-    @staticmethod
-    def get_local_embeddings():
+    @classmethod
+    def get_local_embeddings(cls):
         """获取本地嵌入模型"""
-        return DashScopeEmbeddings(
+        return cls._get_or_create("dashscope", lambda: DashScopeEmbeddings(
             model="text-embedding-v1",
             dashscope_api_key=Config.DASHSCOPE_API_KEY
-        )
+        ))
@@ -1,23 +1,105 @@
 # infrastructure/models.py
+import importlib.util
+import logging
+import threading
+
+import httpx
 from langchain_openai import ChatOpenAI
 from langchain.llms import HuggingFacePipeline
 import torch
 from transformers import AutoTokenizer, AutoModel, pipeline
 
+from infrastructure.config import Config
+
+logger = logging.getLogger(__name__)
+
 
 class ModelProvider:
     """模型提供者，管理不同模型的加载与使用"""
 
-    @staticmethod
-    def get_openai_model(model_name: str, api_key, model_url, temperature: float = 0.2):
+    # 进程内共享的模型客户端，按 (模型名, 接口地址, 温度) 索引，复用底层HTTP连接池
+    _shared_models = {}
+    # 每个接口地址一组 (同步, 异步) httpx 客户端
+    _http_clients = {}
+    # 创建共享模型时会再次获取连接池，使用可重入锁
+    _lock = threading.RLock()
+
+    @classmethod
+    def get_openai_model(cls, model_name: str, api_key, model_url, temperature: float = 0.2):
         """获取OpenAI模型"""
+        http_client, http_async_client = cls.get_http_clients(model_url)
         return ChatOpenAI(
             base_url=model_url,
             model=model_name,
             temperature=temperature,
-            api_key=api_key
+            api_key=api_key,
+            timeout=Config.LLM_TIMEOUT,
+            max_retries=Config.LLM_MAX_RETRIES,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
 
+    @classmethod
+    def get_http_clients(cls, base_url=None):
+        """获取接口地址对应的共享 (同步, 异步) httpx 客户端，不存在时创建"""
+        key = base_url or "default"
+        with cls._lock:
+            clients = cls._http_clients.get(key)
+            if clients is None:
+                clients = cls._create_http_clients()
+                cls._http_clients[key] = clients
+            return clients
+
+    @staticmethod
+    def _create_http_clients():
+        """按配置创建带连接池、长连接和超时设置的 httpx 客户端"""
+        http2 = Config.LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+        if Config.LLM_HTTP2 and not http2:
+            logger.warning("未安装 h2，模型接口连接退回 HTTP/1.1")
+
+        limits = httpx.Limits(
+            max_connections=Config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=Config.LLM_HTTP_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(Config.LLM_TIMEOUT, connect=Config.LLM_CONNECT_TIMEOUT)
+        # 传输层只重试建立连接失败，接口错误由OpenAI客户端按 max_retries 重试
+        return (
+            httpx.Client(
+                transport=httpx.HTTPTransport(http2=http2, limits=limits, retries=Config.LLM_CONNECT_RETRIES),
+                timeout=timeout
+            ),
+            httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(http2=http2, limits=limits, retries=Config.LLM_CONNECT_RETRIES),
+                timeout=timeout
+            )
+        )
+
+    @classmethod
+    async def aclose(cls):
+        """关闭所有共享的HTTP客户端，在服务退出时调用"""
+        with cls._lock:
+            clients = list(cls._http_clients.values())
+            cls._http_clients.clear()
+            cls._shared_models.clear()
+        for http_client, http_async_client in clients:
+            http_client.close()
+            await http_async_client.aclose()
+
+    @classmethod
+    def get_shared_openai_model(cls, model_name: str = None, api_key=None, model_url=None, temperature: float = 0.2):
+        """获取进程内共享的OpenAI模型，未指定的参数使用配置中的默认值"""
+        model_name = model_name or Config.MODEL_NAME
+        api_key = api_key or Config.OPENAI_API_KEY
+        model_url = model_url or Config.MODULE_URL
+        key = (model_name, model_url, api_key, temperature)
+        with cls._lock:
+            model = cls._shared_models.get(key)
+            if model is None:
+                model = cls.get_openai_model(model_name, api_key, model_url, temperature)
+                cls._shared_models[key] = model
+            return model
+
     @staticmethod
     def get_local_model(model_name="THUDM/chatglm3-6b", device="cuda" if torch.cuda.is_available() else "cpu"):
         """获取本地模型实例"""
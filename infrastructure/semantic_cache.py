@@ -0,0 +1,154 @@
+# infrastructure/semantic_cache.py
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from infrastructure.config import Config
+from knowledge_base.bm25_index import tokenize
+
+
+def normalize_query(query):
+    """规范化查询：去除首尾空白和句末标点，合并空白，英文转小写"""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?？!！。.~～ ")
+
+
+def exact_terms(query):
+    """提取查询中的字母数字串（SKU、订单号、型号等），语义命中时这些词必须完全一致"""
+    return frozenset(term for term in tokenize(query) if re.search(r"[a-z0-9]", term))
+
+
+class SemanticCache:
+    """语义回答缓存：按作用域保存 (查询向量, 回答)，相似度超过阈值时直接返回缓存的回答"""
+
+    def __init__(self, embedding, threshold=None, ttl=None, max_entries=None, version_func=None):
+        self.embedding = embedding
+        self.threshold = Config.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl = Config.SEMANTIC_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or Config.SEMANTIC_CACHE_MAX_ENTRIES
+        # 返回知识库当前版本，版本变化后旧回答全部失效
+        self.version_func = version_func or (lambda: 0)
+        self.hits = 0
+        self.misses = 0
+        self._scopes = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def lookup(self, query, scope=None):
+        """查找语义相近的缓存回答，未命中返回None"""
+        normalized = normalize_query(query)
+        if not normalized:
+            return None
+
+        with self._lock:
+            entries = self._get_entries(scope)
+            # 规范化后完全相同的查询无需计算向量
+            entry = entries.get(normalized)
+            if entry is not None and not self._expired(entry):
+                entries.move_to_end(normalized)
+                self.hits += 1
+                return entry["response"]
+            if not entries:
+                self.misses += 1
+                return None
+
+        vector = self._embed(normalized)
+        terms = exact_terms(normalized)
+        with self._lock:
+            entries = self._get_entries(scope)
+            now = time.time()
+            for key in [key for key, entry in entries.items() if self._expired(entry, now)]:
+                del entries[key]
+            # 字母数字串不同的查询（如 AB-123 与 AB-124）向量可能非常接近，但不能共用回答
+            keys = [key for key, entry in entries.items() if entry["terms"] == terms]
+            if keys:
+                scores = np.stack([entries[key]["vector"] for key in keys]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return entries[keys[best]]["response"]
+            self.misses += 1
+            return None
+
+    def store(self, query, response, scope=None):
+        """缓存查询对应的回答"""
+        normalized = normalize_query(query)
+        if not normalized or not response:
+            return
+
+        vector = self._embed(normalized)
+        with self._lock:
+            entries = self._get_entries(scope)
+            entries[normalized] = {
+                "vector": vector,
+                "terms": exact_terms(normalized),
+                "response": response,
+                "created_at": time.time()
+            }
+            entries.move_to_end(normalized)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self):
+        """清空所有缓存"""
+        with self._lock:
+            self._scopes.clear()
+
+    def get_stats(self):
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": sum(len(entries) for entries in self._scopes.values())
+            }
+
+    def _get_entries(self, scope):
+        """获取作用域下的缓存条目，知识库版本变化时先清空缓存"""
+        version = self.version_func()
+        if version != self._version:
+            self._scopes.clear()
+            self._version = version
+        return self._scopes.setdefault(scope or "default", OrderedDict())
+
+    def _expired(self, entry, now=None):
+        return self.ttl > 0 and (now or time.time()) - entry["created_at"] > self.ttl
+
+    def _embed(self, text):
+        """计算单位化的查询向量，便于用点积计算余弦相似度"""
+        vector = np.asarray(self.embedding.embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class ExpertAnswerCache:
+    """专家回答缓存：以路由Agent转给专家的问题为键，跨用户复用与用户无关的专家回答"""
+
+    def __init__(self, cache, shared_experts=None, skip_tools=None):
+        self.cache = cache
+        self.shared_experts = set(Config.SEMANTIC_CACHE_SHARED_EXPERTS if shared_experts is None else shared_experts)
+        self.skip_tools = set(Config.SEMANTIC_CACHE_SKIP_TOOLS if skip_tools is None else skip_tools)
+
+    def lookup(self, expert_name, query):
+        """查找专家对相近问题的缓存回答，专家不可共享或未命中时返回None"""
+        if expert_name not in self.shared_experts:
+            return None
+        return self.cache.lookup(query, f"expert:{expert_name}")
+
+    def store(self, expert_name, query, answer, tool_names=(), has_user_memory=False):
+        """缓存专家回答，返回是否已缓存；调用过有副作用的工具、用户有记忆或回答出错时不缓存"""
+        if expert_name not in self.shared_experts or not answer or "出错" in answer:
+            return False
+        if self.skip_tools.intersection(tool_names):
+            return False
+        # 路由Agent会把用户记忆改写进转给专家的问题，这类问题和回答只属于该用户；查找不受限制，带记忆的用户也能复用通用回答
+        if has_user_memory:
+            return False
+        self.cache.store(query, answer, f"expert:{expert_name}")
+        return True
@@ -0,0 +1,119 @@
+# infrastructure/user_memory.py
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from infrastructure.config import Config
+
+
+class UserMemoryStore:
+    """用户记忆存储，按 user_id 和 info_type 索引，热点用户缓存在内存中"""
+
+    def __init__(self, db_path=None, cache_size=None, max_per_user=None):
+        self.cache_size = cache_size or Config.USER_MEMORY_CACHE_SIZE
+        self.max_per_user = max_per_user or Config.USER_MEMORY_MAX_PER_USER
+        self.conn = sqlite3.connect(db_path or Config.USER_MEMORY_DB_PATH, check_same_thread=False)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.create_tables()
+
+    def create_tables(self):
+        """创建必要的表和索引"""
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_memory (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                info_type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            ''')
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_user_memory_user ON user_memory (user_id, info_type)"
+            )
+            self.conn.commit()
+
+    def add(self, user_id, content, info_type="general"):
+        """保存一条用户记忆，超出单用户上限时淘汰最早的记录"""
+        user_id = str(user_id)
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO user_memory (user_id, info_type, content, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, info_type, content, time.time())
+            )
+            self.conn.execute(
+                "DELETE FROM user_memory WHERE user_id = ? AND id NOT IN "
+                "(SELECT id FROM user_memory WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                (user_id, user_id, self.max_per_user)
+            )
+            self.conn.commit()
+            self._cache.pop(user_id, None)
+
+    def get(self, user_id, info_type=None):
+        """获取用户记忆，返回 (info_type, content) 列表，按写入顺序排列"""
+        user_id = str(user_id)
+        with self._lock:
+            memories = self._cache.get(user_id)
+            if memories is None:
+                memories = self.conn.execute(
+                    "SELECT info_type, content FROM user_memory WHERE user_id = ? ORDER BY id",
+                    (user_id,)
+                ).fetchall()
+                self._cache[user_id] = memories
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(user_id)
+
+        if info_type:
+            return [memory for memory in memories if memory[0] == info_type]
+        return list(memories)
+
+    def migrate_from_vector_store(self, vector_store):
+        """将旧版保存在向量存储中的用户记忆（category="user_memory"）迁入本存储并从向量存储删除，返回迁入的条数"""
+        legacy_filter = {"category": "user_memory"}
+        documents = vector_store.get_by_filter(legacy_filter)
+        if not documents:
+            return 0
+
+        rows = [
+            (str(doc.metadata["user_id"]), doc.metadata.get("info_type") or "general", doc.page_content)
+            for doc in documents if doc.metadata.get("user_id") and doc.page_content
+        ]
+        with self._lock:
+            with self.conn:
+                # 迁移中断后重新执行时，已迁入的记忆不重复写入
+                for user_id, info_type, content in rows:
+                    self.conn.execute(
+                        "INSERT INTO user_memory (user_id, info_type, content, created_at) "
+                        "SELECT ?, ?, ?, ? WHERE NOT EXISTS "
+                        "(SELECT 1 FROM user_memory WHERE user_id = ? AND info_type = ? AND content = ?)",
+                        (user_id, info_type, content, time.time(), user_id, info_type, content)
+                    )
+                for user_id in {row[0] for row in rows}:
+                    self.conn.execute(
+                        "DELETE FROM user_memory WHERE user_id = ? AND id NOT IN "
+                        "(SELECT id FROM user_memory WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                        (user_id, user_id, self.max_per_user)
+                    )
+            self._cache.clear()
+
+        # 写入提交后再删除旧数据；没有 user_id 的旧记忆无法归属，一并删除
+        vector_store.delete_by_filter(legacy_filter)
+        return len(rows)
+
+    def delete(self, user_id, info_type=None):
+        """删除用户记忆，可按类型删除"""
+        user_id = str(user_id)
+        with self._lock:
+            if info_type:
+                self.conn.execute(
+                    "DELETE FROM user_memory WHERE user_id = ? AND info_type = ?", (user_id, info_type)
+                )
+            else:
+                self.conn.execute("DELETE FROM user_memory WHERE user_id = ?", (user_id,))
+            self.conn.commit()
+            self._cache.pop(user_id, None)
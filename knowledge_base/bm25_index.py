@@ -0,0 +1,131 @@
+# knowledge_base/bm25_index.py
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+try:
+    import jieba
+except ImportError:
+    jieba = None
+
+
+def tokenize(text):
+    """中英文混合分词：SKU、订单号、型号等字母数字串保持完整，中文优先使用jieba，未安装时按二元组切分"""
+    text = text.lower()
+    tokens = re.findall(r"[a-z0-9][a-z0-9\-_./]*[a-z0-9]|[a-z0-9]", text)
+    for segment in re.findall(r"[一-鿿]+", text):
+        if jieba is not None:
+            tokens.extend(word for word in jieba.cut_for_search(segment) if word.strip())
+        elif len(segment) == 1:
+            tokens.append(segment)
+        else:
+            tokens.extend(a + b for a, b in zip(segment, segment[1:]))
+    return tokens
+
+
+class BM25Index:
+    """BM25倒排索引，随向量存储增量更新；只保存每个文档的词频，文档内容由向量存储提供"""
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)  # 词 -> {文档ID: 词频}
+        self._doc_terms = {}  # 文档ID -> ({词: 词频}, 词数)，删除时按此清理倒排表，不依赖分词规则
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self._conn = self._connect() if path else None
+        self._load()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add_documents(self, documents, ids):
+        """添加文档，已存在的ID会被覆盖"""
+        rows = []
+        with self._lock:
+            for doc_id, doc in zip(ids, documents):
+                self._remove(doc_id)
+                terms = dict(Counter(tokenize(doc.page_content)))
+                self._add(doc_id, terms)
+                rows.append((doc_id, json.dumps(terms, ensure_ascii=False)))
+            if self._conn is not None and rows:
+                self._conn.executemany("INSERT OR REPLACE INTO doc_terms (doc_id, terms) VALUES (?, ?)", rows)
+
+    def delete(self, ids):
+        """删除文档"""
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+            if self._conn is not None:
+                self._conn.executemany("DELETE FROM doc_terms WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+
+    def search(self, query, top_k=3, candidates=None):
+        """按BM25分数从高到低返回 [(文档ID, 分数)]，candidates 为允许返回的文档ID集合"""
+        with self._lock:
+            if not self._doc_terms:
+                return []
+
+            total = len(self._doc_terms)
+            avg_length = self._total_length / total or 1.0
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if candidates is not None and doc_id not in candidates:
+                        continue
+                    length = self._doc_terms[doc_id][1]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked if top_k is None else ranked[:top_k]
+
+    def save(self):
+        """提交尚未落盘的增量修改"""
+        with self._lock:
+            if self._conn is not None and self._conn.in_transaction:
+                self._conn.commit()
+
+    def _connect(self):
+        """创建WAL模式的连接，按文档保存词频"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS doc_terms (doc_id TEXT PRIMARY KEY, terms TEXT NOT NULL)")
+        conn.commit()
+        return conn
+
+    def _load(self):
+        if self._conn is None:
+            return
+        for doc_id, terms in self._conn.execute("SELECT doc_id, terms FROM doc_terms"):
+            self._add(doc_id, json.loads(terms))
+
+    def _add(self, doc_id, terms):
+        for term, tf in terms.items():
+            self._postings[term][doc_id] = tf
+        length = sum(terms.values())
+        self._doc_terms[doc_id] = (terms, length)
+        self._total_length += length
+
+    def _remove(self, doc_id):
+        entry = self._doc_terms.pop(doc_id, None)
+        if entry is None:
+            return
+        terms, length = entry
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
@@ -1,5 +1,7 @@
 # knowledge_base/document_loader.py
+import multiprocessing
 import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from langchain.document_loaders import (
     TextLoader,
     CSVLoader,
@@ -8,6 +10,8 @@ from langchain.document_loaders import (
 )
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from infrastructure.config import Config
+
 
 class DocumentLoader:
     """文档加载器"""
@@ -19,16 +23,50 @@ class DocumentLoader:
             return []
 
         docs = []
+        files = ((file_path, metadata) for file_path in DocumentLoader.iter_files(directory_path))
+        for file_path, file_docs, error in DocumentLoader.iter_load(files):
+            if error:
+                print(f"加载文件 {file_path} 出错: {str(error)}")
+            else:
+                docs.extend(file_docs)
+
+        return docs
+
+    @staticmethod
+    def iter_files(directory_path):
+        """逐个产出目录中的文件路径"""
         for root, _, files in os.walk(directory_path):
             for file in files:
-                file_path = os.path.join(root, file)
-                try:
-                    file_docs = DocumentLoader.load_file(file_path, metadata)
-                    docs.extend(file_docs)
-                except Exception as e:
-                    print(f"加载文件 {file_path} 出错: {str(e)}")
+                yield os.path.join(root, file)
 
-        return docs
+    @staticmethod
+    def iter_load(files, split=False, loader=None, max_workers=None, max_pending=None):
+        """在进程池中并行加载 (文件路径, 元数据)，按完成顺序产出 (文件路径, 文档列表, 异常)"""
+        # 同时处理中的文件数不超过 max_pending，调用方消费变慢时解析也随之暂停
+        max_workers = max_workers or Config.LOADER_MAX_WORKERS
+        max_pending = max_pending or max_workers * 2
+        # split 为 True 时在工作进程中直接完成分割；loader 为自定义的 loader(文件路径, 元数据)，须是可被子进程导入的模块级函数
+        load = loader or (_load_and_split if split else DocumentLoader.load_file)
+        files = iter(files)
+
+        # 调用方所在进程通常已有事件循环、SQLite和HTTP连接池等线程，fork 可能让子进程卡在这些线程持有的锁上
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            pending = {}
+            while True:
+                for file_path, metadata in files:
+                    pending[executor.submit(load, file_path, metadata)] = file_path
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = pending.pop(future)
+                    try:
+                        yield file_path, future.result(), None
+                    except Exception as e:
+                        yield file_path, [], e
 
     @staticmethod
     def load_file(file_path, metadata=None):
@@ -72,4 +110,9 @@ class DocumentLoader:
             chunk_overlap=chunk_overlap
         )
 
-        return splitter.split_documents(documents)
\ No newline at end of file
+        return splitter.split_documents(documents)
+
+
+def _load_and_split(file_path, metadata=None):
+    """在工作进程中加载并分割单个文件"""
+    return DocumentLoader.split_documents(DocumentLoader.load_file(file_path, metadata))
@@ -0,0 +1,199 @@
+# knowledge_base/embedding_pipeline.py
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from infrastructure.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶限流器，限制每秒发往嵌入接口的请求数"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        """获取令牌，不足时异步等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+class EmbeddingPipeline:
+    """嵌入流水线：分批并发计算向量，限流重试，最后一次性批量写入向量存储"""
+
+    # 进程内共享的令牌桶，按嵌入模型索引
+    _buckets = {}
+    _buckets_lock = threading.Lock()
+
+    def __init__(self, vector_store, batch_size=None, concurrency=None, rate_limit=None, max_retries=None):
+        self.vector_store = vector_store
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.concurrency = concurrency or Config.EMBEDDING_CONCURRENCY
+        self.max_retries = Config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        # 未指定限流速率时，使用同一嵌入模型的所有流水线共享一个令牌桶
+        self.bucket = TokenBucket(rate_limit) if rate_limit else self._get_shared_bucket(vector_store.embedding)
+        self.base_backoff = 1.0
+        self.max_backoff = 30.0
+
+    @classmethod
+    def _get_shared_bucket(cls, embedding):
+        """按嵌入模型获取进程内共享的令牌桶，使总请求速率不超过 EMBEDDING_RATE_LIMIT"""
+        key = getattr(embedding, "model_name", None) or getattr(embedding, "model", None) or id(embedding)
+        with cls._buckets_lock:
+            bucket = cls._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(Config.EMBEDDING_RATE_LIMIT)
+                cls._buckets[key] = bucket
+            return bucket
+
+    def ingest(self, documents):
+        """同步入口，返回本次入库的统计信息"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aingest(documents))
+
+        # 当前线程已有运行中的事件循环，放到独立线程中执行
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aingest(documents)).result()
+
+    async def aingest(self, documents):
+        """异步入口，返回本次入库的统计信息"""
+        documents = list(documents)
+        start = time.perf_counter()
+        if not documents:
+            return self._build_stats(0, 0, start)
+
+        batches = [documents[i:i + self.batch_size] for i in range(0, len(documents), self.batch_size)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def embed(batch):
+            async with semaphore:
+                return await self._embed_batch([doc.page_content for doc in batch])
+
+        results = await asyncio.gather(*(embed(batch) for batch in batches))
+        embeddings = [vector for result in results for vector in result]
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.vector_store.add_embeddings, documents, embeddings)
+
+        stats = self._build_stats(len(documents), len(batches), start)
+        logger.info(
+            f"入库完成：{stats['chunks']} 个内容块，{stats['batches']} 批，"
+            f"耗时 {stats['seconds']:.2f}s，吞吐 {stats['chunks_per_second']:.1f} chunks/s"
+        )
+        return stats
+
+    def ingest_stream(self, chunks, on_batch=None):
+        """同步入口：流式入库，返回统计信息"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aingest_stream(chunks, on_batch))
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aingest_stream(chunks, on_batch)).result()
+
+    async def aingest_stream(self, chunks, on_batch=None):
+        """流式入库：在后台线程中迭代内容块（可包含文件解析），按批次并发嵌入并逐批写入"""
+        # on_batch(批次) 在该批写入向量存储后于线程池中调用，调用方据此确认哪些内容块已落盘
+        # 队列长度有限，嵌入跟不上时会反压上游的解析，内存占用与语料规模无关
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        done = object()
+        stopped = threading.Event()
+        counts = {"chunks": 0, "batches": 0}
+
+        def produce():
+            try:
+                batch = []
+                for chunk in chunks:
+                    if stopped.is_set():
+                        return
+                    batch.append(chunk)
+                    if len(batch) >= self.batch_size:
+                        asyncio.run_coroutine_threadsafe(queue.put(batch), loop).result()
+                        batch = []
+                if batch:
+                    asyncio.run_coroutine_threadsafe(queue.put(batch), loop).result()
+            except Exception as e:
+                asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+            finally:
+                for _ in range(self.concurrency):
+                    asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+        async def consume():
+            while True:
+                batch = await queue.get()
+                if batch is done:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                embeddings = await self._embed_batch([doc.page_content for doc in batch])
+                await loop.run_in_executor(None, self.vector_store.add_embeddings, batch, embeddings)
+                if on_batch is not None:
+                    await loop.run_in_executor(None, on_batch, batch)
+                counts["chunks"] += len(batch)
+                counts["batches"] += 1
+
+        producer = loop.run_in_executor(None, produce)
+        consumers = [asyncio.ensure_future(consume()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*consumers)
+        finally:
+            stopped.set()
+            for consumer in consumers:
+                consumer.cancel()
+            # 消费者异常退出时清空队列，避免生产者阻塞
+            while not producer.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.sleep(0.01)
+
+        stats = self._build_stats(counts["chunks"], counts["batches"], start)
+        logger.info(
+            f"流式入库完成：{stats['chunks']} 个内容块，{stats['batches']} 批，"
+            f"耗时 {stats['seconds']:.2f}s，吞吐 {stats['chunks_per_second']:.1f} chunks/s"
+        )
+        return stats
+
+    async def _embed_batch(self, texts):
+        """计算一批文本的向量，失败时指数退避加随机抖动重试"""
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                return await self.vector_store.embedding.aembed_documents(texts)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+                logger.warning(f"嵌入请求失败，{delay:.2f}s 后第 {attempt + 1} 次重试: {str(e)}")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _build_stats(chunks, batches, start):
+        seconds = time.perf_counter() - start
+        return {
+            "chunks": chunks,
+            "batches": batches,
+            "seconds": seconds,
+            "chunks_per_second": chunks / seconds if seconds > 0 else 0.0
+        }
@@ -1,54 +1,172 @@
 # knowledge_base/knowledge_base_manager.py
 from infrastructure.config import Config
 from .document_loader import DocumentLoader
+from .embedding_pipeline import EmbeddingPipeline
+from .manifest import KnowledgeBaseManifest, hash_file, make_chunk_ids
 import os
+import threading
 
 
 
 class KnowledgeBaseManager:
     """知识库管理器"""
 
+    # 知识库目录下按分类存放的子目录
+    CATEGORIES = ("product", "technical")
+
     def __init__(self, vector_store):
         self.vector_store = vector_store
         self.knowledge_base_path = Config.KNOWLEDGE_BASE_PATH
+        self.pipeline = EmbeddingPipeline(vector_store)
+        self.manifest = KnowledgeBaseManifest(os.path.join(vector_store.path, "manifest.json"))
+        self._commit_lock = threading.Lock()
 
     def initialize_knowledge_base(self):
-        """初始化知识库，加载所有文档"""
+        """初始化知识库，增量同步所有文档"""
         os.makedirs(self.knowledge_base_path, exist_ok=True)
+        stats = self.sync()
+        print(f"知识库初始化完成：新增 {stats['added']} 个文件，更新 {stats['updated']} 个，"
+              f"删除 {stats['removed']} 个，未变化 {stats['unchanged']} 个，失败 {stats['failed']} 个")
+        return stats
 
-        # 加载产品文档
-        product_path = os.path.join(self.knowledge_base_path, "product")
-        if os.path.exists(product_path):
-            print("加载产品文档...")
-            product_docs = DocumentLoader.load_directory(
-                product_path,
-                metadata={"category": "product"}
-            )
-            product_chunks = DocumentLoader.split_documents(product_docs)
-            self.vector_store.add_documents(product_chunks)
-
-        # 加载技术文档
-        technical_path = os.path.join(self.knowledge_base_path, "technical")
-        if os.path.exists(technical_path):
-            print("加载技术文档...")
-            technical_docs = DocumentLoader.load_directory(
-                technical_path,
-                metadata={"category": "technical"}
+    def sync(self):
+        """增量同步知识库：只嵌入新增或修改的文件，删除已移除文件的内容块"""
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0, "chunks": 0}
+        seen = set()
+        changed = {}
+
+        for category in self.CATEGORIES:
+            category_path = os.path.join(self.knowledge_base_path, category)
+            if not os.path.exists(category_path):
+                continue
+            print(f"检查 {category} 文档...")
+            for file_path in DocumentLoader.iter_files(category_path):
+                file_path = os.path.abspath(file_path)
+                seen.add(file_path)
+                try:
+                    file_hash = hash_file(file_path)
+                except OSError as e:
+                    print(f"读取文件 {file_path} 出错: {str(e)}")
+                    stats["failed"] += 1
+                    continue
+                entry = self.manifest.get(file_path)
+                if entry and entry["hash"] == file_hash:
+                    stats["unchanged"] += 1
+                else:
+                    changed[file_path] = (category, file_hash, entry)
+
+        # 并行解析变更的文件，解析结果边分割边流式写入向量存储；文件的内容块全部写入后才删除旧内容块并更新清单
+        if changed:
+            pending = {}
+            ingest_stats = self.pipeline.ingest_stream(
+                self._iter_changed_chunks(changed, stats, pending),
+                on_batch=lambda batch: self._on_batch_written(batch, changed, stats, pending)
             )
-            technical_chunks = DocumentLoader.split_documents(technical_docs)
-            self.vector_store.add_documents(technical_chunks)
+            print(f"写入 {ingest_stats['chunks']} 个内容块，吞吐 {ingest_stats['chunks_per_second']:.1f} chunks/s")
+
+        # 删除已不存在的文件对应的内容块
+        for file_path in self.manifest.paths() - seen:
+            entry = self.manifest.get(file_path)
+            if entry["category"] in self.CATEGORIES and not os.path.exists(file_path):
+                self.vector_store.delete(entry["chunk_ids"])
+                self.manifest.remove(file_path)
+                stats["removed"] += 1
+
+        self.manifest.save()
+        return stats
+
+    def _iter_changed_chunks(self, changed, stats, pending):
+        """逐个文件产出变更文件的内容块，并在 pending 中登记各文件尚未写入的内容块ID"""
+        files = ((file_path, {"category": category}) for file_path, (category, _, _) in changed.items())
+        for file_path, chunks, error in DocumentLoader.iter_load(files, split=True):
+            if error:
+                print(f"加载文件 {file_path} 出错: {str(error)}")
+                with self._commit_lock:
+                    stats["failed"] += 1
+                continue
+            category, file_hash, entry = changed[file_path]
+            chunk_ids = self._assign_chunk_ids(file_path, file_hash, chunks)
+            with self._commit_lock:
+                if chunk_ids:
+                    pending[file_path] = (chunk_ids, set(chunk_ids))
+                else:
+                    self._commit_file(file_path, file_hash, category, entry, chunk_ids)
+                    stats["updated" if entry else "added"] += 1
+            yield from chunks
 
-        print("知识库初始化完成")
+    def _on_batch_written(self, batch, changed, stats, pending):
+        """一批内容块写入后，提交其中内容块已全部写入的文件"""
+        with self._commit_lock:
+            for chunk in batch:
+                file_path = chunk.metadata["source"]
+                if file_path not in pending:
+                    continue
+                chunk_ids, remaining = pending[file_path]
+                remaining.discard(chunk.metadata["chunk_id"])
+                if remaining:
+                    continue
+                del pending[file_path]
+                category, file_hash, entry = changed[file_path]
+                self._commit_file(file_path, file_hash, category, entry, chunk_ids)
+                stats["updated" if entry else "added"] += 1
+                stats["chunks"] += len(chunk_ids)
 
     def add_document(self, file_path, category=None):
-        """添加单个文档到知识库"""
+        """添加单个文档到知识库，文件内容未变化时不重复嵌入"""
+        file_hash = hash_file(file_path)
+        entry = self.manifest.get(file_path)
+        if entry and entry["hash"] == file_hash:
+            return 0
+
         metadata = {"category": category} if category else {}
         documents = DocumentLoader.load_file(file_path, metadata)
         chunks = DocumentLoader.split_documents(documents)
-        self.vector_store.add_documents(chunks)
+        chunk_ids = self._assign_chunk_ids(file_path, file_hash, chunks)
+        self._ingest(chunks)
+        self._commit_file(file_path, file_hash, category, entry, chunk_ids)
+        self.manifest.save()
         return len(chunks)
 
+    @staticmethod
+    def _assign_chunk_ids(file_path, file_hash, chunks):
+        """为内容块分配稳定ID，返回ID列表"""
+        chunk_ids = make_chunk_ids(file_path, file_hash, len(chunks))
+        for chunk, chunk_id in zip(chunks, chunk_ids):
+            chunk.metadata["chunk_id"] = chunk_id
+        return chunk_ids
+
+    def _commit_file(self, file_path, file_hash, category, entry, chunk_ids):
+        """新内容块写入后删除该文件旧版本中不再使用的内容块，并更新清单"""
+        if entry:
+            stale = set(entry["chunk_ids"]) - set(chunk_ids)
+            if stale:
+                self.vector_store.delete(list(stale))
+        self.manifest.set(file_path, file_hash, category, chunk_ids)
+
+    def _ingest(self, chunks):
+        """通过嵌入流水线批量写入向量存储"""
+        stats = self.pipeline.ingest(chunks)
+        print(f"写入 {stats['chunks']} 个内容块，吞吐 {stats['chunks_per_second']:.1f} chunks/s")
+        return stats
+
     def search(self, query, category=None, top_k=3):
-        """搜索知识库"""
+        """混合检索知识库：向量检索与BM25关键词检索的结果按倒数排名融合"""
         filter_dict = {"category": category} if category else None
-        return self.vector_store.search(query, filter=filter_dict, top_k=top_k)
\ No newline at end of file
+        dense_results = self.vector_store.search(query, filter=filter_dict, top_k=top_k)
+        keyword_results = self.vector_store.keyword_search(query, filter=filter_dict, top_k=top_k)
+        return _reciprocal_rank_fusion([dense_results, keyword_results], top_k)
+
+
+def _reciprocal_rank_fusion(result_lists, top_k, k=None):
+    """倒数排名融合（RRF）：score = Σ 1 / (k + rank)"""
+    k = k or Config.RRF_K
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = doc.metadata.get("chunk_id") or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:top_k]]
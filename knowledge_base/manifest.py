@@ -0,0 +1,70 @@
+# knowledge_base/manifest.py
+import hashlib
+import json
+import os
+import threading
+
+
+def hash_file(file_path, block_size=1 << 20):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_source_id(file_path, file_hash):
+    """根据文件路径和内容哈希生成紧凑的来源ID"""
+    path_hash = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return f"{path_hash[:8]}-{file_hash[:12]}"
+
+
+def make_doc_id(source):
+    """根据来源（文件名或路径）生成稳定的文档ID"""
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+
+def make_chunk_ids(file_path, file_hash, count):
+    """根据文件路径和内容哈希生成稳定的内容块ID"""
+    source_id = make_source_id(file_path, file_hash)
+    return [f"{source_id}-{i}" for i in range(count)]
+
+
+class KnowledgeBaseManifest:
+    """知识库清单：记录每个文件的内容哈希、分类和内容块ID，用于增量同步"""
+
+    def __init__(self, path):
+        self.path = path
+        self._files = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._files = json.load(f)
+
+    def get(self, file_path):
+        return self._files.get(os.path.abspath(file_path))
+
+    def set(self, file_path, file_hash, category, chunk_ids):
+        with self._lock:
+            self._files[os.path.abspath(file_path)] = {
+                "hash": file_hash,
+                "category": category,
+                "chunk_ids": list(chunk_ids)
+            }
+
+    def remove(self, file_path):
+        with self._lock:
+            return self._files.pop(os.path.abspath(file_path), None)
+
+    def paths(self):
+        return set(self._files)
+
+    def save(self):
+        """原子地写入清单文件"""
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._files, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
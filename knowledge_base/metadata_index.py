@@ -0,0 +1,46 @@
+# knowledge_base/metadata_index.py
+import threading
+from collections import defaultdict
+
+
+class MetadataIndex:
+    """元数据倒排索引：(键, 值) -> 向量在FAISS索引中的位置集合"""
+
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def add(self, position, metadata):
+        """登记一个向量位置的元数据，只索引可哈希的标量值"""
+        with self._lock:
+            for key, value in metadata.items():
+                if isinstance(value, (str, int, float, bool)) or value is None:
+                    self._postings[(key, value)].add(position)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+
+    def lookup(self, filter):
+        """返回满足所有条件的位置集合；过滤器包含不支持的条件时返回None"""
+        conditions = []
+        for key, value in filter.items():
+            if isinstance(value, dict):
+                if set(value) != {"$eq"}:
+                    return None
+                value = value["$eq"]
+            if key.startswith("$"):
+                return None
+            conditions.append((key, value))
+
+        with self._lock:
+            postings = sorted((self._postings.get(condition, set()) for condition in conditions), key=len)
+            if not postings:
+                return None
+            # 从最小的集合开始求交集
+            result = set(postings[0])
+            for positions in postings[1:]:
+                result &= positions
+                if not result:
+                    break
+            return result
@@ -0,0 +1,209 @@
+# knowledge_base/reranker.py
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import List
+
+from infrastructure.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _chunk_id(document) -> str:
+    """内容块标识，优先使用元数据中的chunk_id"""
+    return document.metadata.get("chunk_id") or _hash_text(document.page_content)
+
+
+def _lexical_features(text: str) -> set:
+    """提取中文字符二元组和英文/数字词，用于轻量打分"""
+    text = text.lower()
+    features = set(re.findall(r"[a-z0-9][a-z0-9\-_.]*", text))
+    chars = re.findall(r"[一-鿿]", text)
+    features.update(a + b for a, b in zip(chars, chars[1:]))
+    return features
+
+
+def lexical_score(query: str, passage: str) -> float:
+    """轻量打分：查询特征在段落中的覆盖率"""
+    query_features = _lexical_features(query)
+    if not query_features:
+        return 0.0
+    return len(query_features & _lexical_features(passage)) / len(query_features)
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_reranker_model():
+    """获取进程内共享的重排序模型，首次调用时才加载；配置了 RERANKER_SOCKET 时使用独立进程中的模型"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if Config.RERANKER_SOCKET:
+                    _model = RemoteReranker(Config.RERANKER_SOCKET, Config.RERANKER_AUTHKEY)
+                else:
+                    _model = _load_local_model()
+    return _model
+
+
+def _get_authkey(authkey):
+    """获取连接认证密钥，未配置时拒绝使用socket"""
+    # 连接上传输的是pickle数据，必须先通过密钥认证，否则能连上socket的进程都可以让对端反序列化任意对象
+    authkey = authkey or Config.RERANKER_AUTHKEY
+    if not authkey:
+        raise ValueError("使用重排序socket时必须配置 RERANKER_AUTHKEY")
+    return authkey.encode("utf-8") if isinstance(authkey, str) else authkey
+
+
+def _load_local_model():
+    from FlagEmbedding import FlagReranker
+
+    logger.info(f"加载重排序模型：{Config.RERANKER_MODEL}")
+    return FlagReranker(Config.RERANKER_MODEL, use_fp16=Config.RERANKER_USE_FP16)
+
+
+class RemoteReranker:
+    """通过本地socket调用独立进程中的重排序模型，接口与FlagReranker.compute_score一致"""
+
+    def __init__(self, address, authkey=None):
+        self.address = address
+        self.authkey = _get_authkey(authkey)
+
+    def compute_score(self, pairs, batch_size=32, max_length=512):
+        with Client(self.address, family="AF_UNIX", authkey=self.authkey) as conn:
+            conn.send((pairs, batch_size, max_length))
+            result = conn.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def serve_reranker(address=None, authkey=None):
+    """启动重排序模型进程，同一主机上的所有worker共享一份模型权重"""
+    address = address or Config.RERANKER_SOCKET
+    authkey = _get_authkey(authkey)
+    if os.path.exists(address):
+        os.unlink(address)
+
+    model = _load_local_model()
+    lock = threading.Lock()
+
+    def handle(conn):
+        with conn:
+            try:
+                pairs, batch_size, max_length = conn.recv()
+                with lock:
+                    scores = model.compute_score(pairs, batch_size=batch_size, max_length=max_length)
+                conn.send(scores if isinstance(scores, list) else [scores])
+            except Exception as e:
+                logger.error(f"重排序请求处理失败: {str(e)}", exc_info=True)
+                conn.send(RuntimeError(str(e)))
+
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+        # socket文件只允许服务进程的用户访问
+        os.chmod(address, 0o600)
+        logger.info(f"重排序服务已启动：{address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError) as e:
+                logger.warning(f"拒绝未通过认证的重排序连接: {str(e)}")
+                continue
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+class RerankerService:
+    """重排序服务：一次批量计算所有 (查询, 段落) 分数，缓存结果，超出延迟预算时降级为轻量打分"""
+
+    def __init__(self, model=None, max_length=None, batch_size=None, cache_size=None, latency_budget=None):
+        self._model = model
+        self.max_length = max_length or Config.RERANK_MAX_LENGTH
+        self.batch_size = batch_size or Config.RERANK_BATCH_SIZE
+        self.cache_size = cache_size or Config.RERANK_CACHE_SIZE
+        self.latency_budget = Config.RERANK_LATENCY_BUDGET if latency_budget is None else latency_budget
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # 单个段落打分耗时的指数滑动平均（秒）
+        self._pair_latency = None
+
+    @property
+    def model(self):
+        """重排序模型，未指定时首次使用才加载共享模型"""
+        if self._model is None:
+            self._model = get_reranker_model()
+        return self._model
+
+    def rerank(self, query: str, documents: List, top_k: int) -> List:
+        """按相关性对文档重排序，返回前 top_k 个文档"""
+        if not documents:
+            return []
+
+        scores = self.score(query, documents)
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        return [documents[i] for i in order[:top_k]]
+
+    def score(self, query: str, documents: List) -> List[float]:
+        """计算每个文档与查询的相关性分数"""
+        query_hash = _hash_text(query)
+        keys = [(query_hash, _chunk_id(doc)) for doc in documents]
+
+        with self._lock:
+            scores = [self._cache.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    self._cache.move_to_end(key)
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if not missing:
+            return scores
+
+        if self._over_budget(len(missing)):
+            logger.info(f"重排序预计超出延迟预算，使用轻量打分：{len(documents)} 个段落")
+            return [lexical_score(query, doc.page_content) for doc in documents]
+
+        pairs = [[query, documents[i].page_content] for i in missing]
+        start = time.perf_counter()
+        new_scores = self.model.compute_score(pairs, batch_size=self.batch_size, max_length=self.max_length)
+        if not isinstance(new_scores, list):
+            new_scores = [new_scores]
+        self._record_latency((time.perf_counter() - start) / len(pairs))
+
+        with self._lock:
+            for i, score in zip(missing, new_scores):
+                scores[i] = score
+                self._cache[keys[i]] = score
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scores
+
+    def _over_budget(self, pair_count: int) -> bool:
+        """根据历史耗时预测本次打分是否会超出延迟预算"""
+        if not self.latency_budget or self._pair_latency is None:
+            return False
+        if self._pair_latency * pair_count <= self.latency_budget:
+            return False
+        # 逐步衰减估计值，负载下降后重新尝试模型打分
+        self._pair_latency *= 0.9
+        return True
+
+    def _record_latency(self, seconds_per_pair: float):
+        if self._pair_latency is None:
+            self._pair_latency = seconds_per_pair
+        else:
+            self._pair_latency = 0.8 * self._pair_latency + 0.2 * seconds_per_pair
+
+
+if __name__ == "__main__":
+    serve_reranker()
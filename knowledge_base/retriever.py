@@ -0,0 +1,26 @@
+# knowledge_base/retriever.py
+import asyncio
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+class KnowledgeBaseRetriever(BaseRetriever):
+    """将 BaseVectorStore 适配为LangChain检索器，供检索问答链使用"""
+
+    vector_store: Any
+    top_k: int = 5
+    filter: Optional[dict] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.vector_store.search(query, filter=self.filter, top_k=self.top_k)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # 向量检索是同步阻塞调用，放到线程中执行以免阻塞事件循环
+        return await asyncio.to_thread(self.vector_store.search, query, self.filter, self.top_k)
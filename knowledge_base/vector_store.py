@@ -1,37 +1,84 @@
 # knowledge_base/vector_store.py
+import atexit
+import logging
 import os
+import threading
+import uuid
+from collections import OrderedDict
+import numpy as np
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from infrastructure.config import Config
 from infrastructure.embeddings import EmbeddingProvider
+from knowledge_base.bm25_index import BM25Index
+from knowledge_base.metadata_index import MetadataIndex
+from knowledge_base.retriever import KnowledgeBaseRetriever
+
+logger = logging.getLogger(__name__)
 
 
 class VectorStoreFactory:
     """向量存储工厂"""
 
-    @staticmethod
-    def create_vector_store(store_type=None, embedding=None):
-        """创建向量存储"""
-        store_type = store_type or Config.VECTOR_STORE_TYPE
+    # 进程内共享的向量存储实例，按 (存储类型, 存储路径) 索引
+    _stores = {}
+    _lock = threading.Lock()
 
-        if not embedding:
-            if hasattr(Config, "EMBEDDING_TYPE") and Config.EMBEDDING_TYPE == "OPENAI":
-                embedding = EmbeddingProvider.get_openai_embeddings()
-            elif hasattr(Config, "EMBEDDING_TYPE") and Config.EMBEDDING_TYPE == "DASHSCOPE":
-                embedding = EmbeddingProvider.get_local_embeddings()
-
-        if embedding is None:
-            raise ValueError(f"没有支持的向量模型: {embedding}")
+    @classmethod
+    def create_vector_store(cls, store_type=None, embedding=None):
+        """获取向量存储，同一类型和路径在进程内只创建一次"""
+        store_type = store_type or Config.VECTOR_STORE_TYPE
 
         if store_type == "chroma":
-            path = os.path.join(Config.VECTOR_STORE_PATH, "chroma")
-            return ChromaVectorStore(path=path, embedding=embedding)
+            store_class = ChromaVectorStore
         elif store_type == "faiss":
-            path = os.path.join(Config.VECTOR_STORE_PATH, "faiss")
-            return FAISSVectorStore(path=path, embedding=embedding)
+            store_class = FAISSVectorStore
         else:
             raise ValueError(f"不支持的向量存储类型: {store_type}")
 
+        path = os.path.join(Config.VECTOR_STORE_PATH, store_type)
+        key = (store_type, os.path.abspath(path))
+
+        with cls._lock:
+            store = cls._stores.get(key)
+            if store is None:
+                embedding = embedding or cls._get_default_embedding()
+                store = store_class(path=path, embedding=embedding)
+                cls._stores[key] = store
+            elif embedding is not None and embedding is not store.embedding:
+                # 同一路径的向量必须来自同一个嵌入模型，不能静默返回使用其他模型的存储
+                raise ValueError(f"向量存储 {path} 已使用其他嵌入模型创建，不能指定不同的嵌入模型")
+            return store
+
+    @staticmethod
+    def _get_default_embedding():
+        """根据配置获取默认的嵌入模型"""
+        embedding = None
+        if hasattr(Config, "EMBEDDING_TYPE") and Config.EMBEDDING_TYPE == "OPENAI":
+            embedding = EmbeddingProvider.get_openai_embeddings()
+        elif hasattr(Config, "EMBEDDING_TYPE") and Config.EMBEDDING_TYPE == "DASHSCOPE":
+            embedding = EmbeddingProvider.get_local_embeddings()
+
+        if embedding is None:
+            raise ValueError(f"没有支持的向量模型: {embedding}")
+        return embedding
+
+    @classmethod
+    def flush_all(cls):
+        """将所有向量存储中尚未持久化的写入落盘"""
+        with cls._lock:
+            stores = list(cls._stores.values())
+        for store in stores:
+            store.flush()
+
+    @classmethod
+    def clear(cls):
+        """清空已缓存的向量存储实例"""
+        with cls._lock:
+            cls._stores.clear()
+
 
 class BaseVectorStore:
     """基础向量存储抽象类"""
@@ -40,22 +87,209 @@ class BaseVectorStore:
         self.path = path
         self.embedding = embedding
         self.vector_store = None
+        # 每次写入或删除后递增，供上层缓存判断知识库是否变化
+        self.version = 0
+
+        # 延迟写入：新增文档先进入内存，按定时、数量阈值或退出时持久化
+        self.write_behind = Config.VECTOR_STORE_WRITE_BEHIND
+        self._pending = 0
+        self._flush_timer = None
+        self._lock = threading.RLock()
+        atexit.register(self.flush)
+
+        # 与向量索引同步维护的BM25关键词索引
+        self.keyword_index = BM25Index(os.path.join(path, "bm25.sqlite3"))
 
     def add_documents(self, documents):
         """添加文档到向量存储"""
         raise NotImplementedError
 
+    def add_embeddings(self, documents, embeddings):
+        """添加已计算好向量的文档到向量存储"""
+        raise NotImplementedError
+
     def search(self, query, filter=None, top_k=3):
         """搜索相关文档"""
         raise NotImplementedError
 
+    def keyword_search(self, query, filter=None, top_k=3):
+        """BM25关键词检索，按分数从高到低返回文档"""
+        with self._lock:
+            if not filter:
+                ranked = self.keyword_index.search(query, top_k=top_k)
+                return self._get_documents([doc_id for doc_id, _ in ranked])
+
+            # 不预先取出分类下的全部ID（大分类时开销与分类规模成正比）；
+            # 按分数顺序分批取出命中文档并过滤，批大小逐次翻倍，凑够 top_k 即停止
+            where = _normalize_filter(filter)
+            ranked = [doc_id for doc_id, _ in self.keyword_index.search(query, top_k=None)]
+            results = []
+            start, size = 0, top_k * 2
+            while start < len(ranked) and len(results) < top_k:
+                documents = self._get_documents(ranked[start:start + size])
+                results.extend(doc for doc in documents if _match_filter(doc.metadata, where))
+                start, size = start + size, size * 2
+            return results[:top_k]
+
+    def delete(self, ids):
+        """按内容块ID删除文档"""
+        raise NotImplementedError
+
+    def get_by_filter(self, filter):
+        """获取元数据满足过滤条件的文档"""
+        if not filter:
+            raise ValueError("查询条件不能为空")
+        with self._lock:
+            return self._get_documents(self._find_ids(filter))
+
+    def find_ids(self, filter):
+        """获取元数据满足过滤条件的内容块ID"""
+        if not filter:
+            raise ValueError("查询条件不能为空")
+        with self._lock:
+            return self._find_ids(filter)
+
+    def delete_by_filter(self, filter):
+        """删除元数据满足过滤条件的文档，返回删除的数量"""
+        if not filter:
+            raise ValueError("删除条件不能为空")
+        with self._lock:
+            ids = self._find_ids(filter)
+            self.delete(ids)
+        return len(ids)
+
+    def _find_ids(self, filter):
+        """查找元数据满足过滤条件的内容块ID，子类可使用索引加速"""
+        if not self.vector_store:
+            return []
+        where = _normalize_filter(filter)
+        return [doc_id for doc_id, doc in self._iter_stored_documents() if _match_filter(doc.metadata, where)]
+
+    def as_retriever(self, search_kwargs=None):
+        """获取LangChain检索器，search_kwargs 支持 k 和 filter"""
+        search_kwargs = search_kwargs or {}
+        return KnowledgeBaseRetriever(
+            vector_store=self,
+            top_k=search_kwargs.get("k", 5),
+            filter=search_kwargs.get("filter")
+        )
+
+    def flush(self):
+        """将尚未持久化的写入落盘"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._pending:
+                self._persist()
+                self._pending = 0
+            self.keyword_index.save()
+
+    def _assign_ids(self, documents):
+        """为文档分配内容块ID（记录在元数据chunk_id中），并同步写入关键词索引"""
+        ids = [doc.metadata.setdefault("chunk_id", str(uuid.uuid4())) for doc in documents]
+        self.keyword_index.add_documents(documents, ids)
+        return ids
+
+    def _iter_stored_documents(self):
+        """遍历已持久化的 (ID, 文档)，由子类实现"""
+        raise NotImplementedError
+
+    def _get_documents(self, ids):
+        """按ID顺序获取文档，跳过不存在的ID，由子类实现"""
+        raise NotImplementedError
+
+    def _ensure_keyword_index(self):
+        """关键词索引为空时，从已有的向量存储中重建"""
+        if len(self.keyword_index) or not self.vector_store:
+            return
+        ids, documents = [], []
+        for doc_id, doc in self._iter_stored_documents():
+            ids.append(doc_id)
+            documents.append(doc)
+        if documents:
+            logger.info(f"从向量存储重建关键词索引：{len(documents)} 个内容块")
+            self.keyword_index.add_documents(documents, ids)
+            self.keyword_index.save()
+
+    def _persist(self):
+        """持久化内存中的写入，由子类实现"""
+        raise NotImplementedError
+
+    def _mark_dirty(self, count):
+        """记录新增的未持久化文档，并按配置决定何时落盘"""
+        with self._lock:
+            self.version += 1
+            self._pending += count
+            if not self.write_behind or self._pending >= Config.VECTOR_STORE_FLUSH_THRESHOLD:
+                self.flush()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(Config.VECTOR_STORE_FLUSH_INTERVAL, self._flush_quietly)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush_quietly(self):
+        """定时刷盘，出错时只记录日志"""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"向量存储刷盘失败: {str(e)}", exc_info=True)
+
+
+def _normalize_filter(filter):
+    """将简单的 {key: value} 过滤器转换为Chroma的where格式"""
+    if not filter or not isinstance(filter, dict):
+        return filter
+
+    # 兼容旧的 {"metadata": {...}} 写法
+    if set(filter) == {"metadata"}:
+        filter = filter["metadata"]
+
+    conditions = []
+    for key, value in filter.items():
+        if key.startswith("$") or isinstance(value, dict):
+            conditions.append({key: value})
+        else:
+            conditions.append({key: {"$eq": value}})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _match_filter(metadata, where):
+    """在内存中按Chroma的where格式匹配元数据"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_match_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(_match_filter(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, expected in condition.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
 
 class ChromaVectorStore(BaseVectorStore):
     """基于Chroma的向量存储"""
 
     def __init__(self, path, embedding):
         super().__init__(path, embedding)
+        # 尚未落盘的写入，按内容块ID索引：ID -> (文档, 向量)，同一ID重复写入时只保留最新的
+        self._buffer = OrderedDict()
         self._initialize_store()
+        self._ensure_keyword_index()
 
     def _initialize_store(self):
         """初始化向量存储"""
@@ -75,11 +309,93 @@ class ChromaVectorStore(BaseVectorStore):
 
     def add_documents(self, documents):
         """添加文档到向量存储"""
+        if not documents:
+            return
+
+        embeddings = self.embedding.embed_documents([doc.page_content for doc in documents])
+        self.add_embeddings(documents, embeddings)
+
+    def add_embeddings(self, documents, embeddings):
+        """添加已计算好向量的文档到向量存储"""
         if not self.vector_store:
             self._initialize_store()
 
-        self.vector_store.add_documents(documents)
-        self.vector_store.persist()
+        if not documents:
+            return
+
+        with self._lock:
+            ids = self._assign_ids(documents)
+            for doc_id, doc, vector in zip(ids, documents, embeddings):
+                self._buffer.pop(doc_id, None)
+                self._buffer[doc_id] = (doc, vector)
+            self._mark_dirty(len(documents))
+
+    def _persist(self):
+        """将缓冲区中的文档一次性写入Chroma"""
+        buffer, self._buffer = self._buffer, OrderedDict()
+        try:
+            self._upsert([(doc_id, doc, vector) for doc_id, (doc, vector) in buffer.items()])
+        except Exception:
+            # 写入失败时放回缓冲区，期间新写入的同ID文档优先
+            buffer.update(self._buffer)
+            self._buffer = buffer
+            raise
+
+    def delete(self, ids):
+        """按内容块ID删除文档，包括尚未落盘的文档"""
+        if not ids:
+            return
+
+        with self._lock:
+            id_set = set(ids)
+            for doc_id in id_set:
+                self._buffer.pop(doc_id, None)
+            self.keyword_index.delete(ids)
+            self.vector_store.delete(ids=list(ids))
+            self._mark_dirty(0)
+
+    def _find_ids(self, filter):
+        where = _normalize_filter(filter)
+        ids = self.vector_store.get(where=where, include=[])["ids"]
+        ids.extend(doc_id for doc_id, (doc, _) in self._buffer.items() if _match_filter(doc.metadata, where))
+        return ids
+
+    def _iter_stored_documents(self):
+        data = self.vector_store.get(include=["documents", "metadatas"])
+        for doc_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"]):
+            yield doc_id, Document(page_content=text, metadata=metadata or {})
+
+    def _get_documents(self, ids):
+        # 缓冲区中的文档比已落盘的更新
+        documents = {doc_id: self._buffer[doc_id][0] for doc_id in ids if doc_id in self._buffer}
+        stored_ids = [doc_id for doc_id in ids if doc_id not in documents]
+        if stored_ids:
+            data = self.vector_store.get(ids=stored_ids, include=["documents", "metadatas"])
+            for doc_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"]):
+                documents[doc_id] = Document(page_content=text, metadata=metadata or {})
+        return [documents[doc_id] for doc_id in ids if doc_id in documents]
+
+    def _upsert(self, items):
+        if not items:
+            return
+
+        # Chroma不接受空元数据，有元数据和无元数据的文档分开写入
+        collection = self.vector_store._collection
+        with_meta = [item for item in items if item[1].metadata]
+        without_meta = [item for item in items if not item[1].metadata]
+        if with_meta:
+            collection.upsert(
+                ids=[item[0] for item in with_meta],
+                embeddings=[item[2] for item in with_meta],
+                documents=[item[1].page_content for item in with_meta],
+                metadatas=[item[1].metadata for item in with_meta]
+            )
+        if without_meta:
+            collection.upsert(
+                ids=[item[0] for item in without_meta],
+                embeddings=[item[2] for item in without_meta],
+                documents=[item[1].page_content for item in without_meta]
+            )
 
     def search(self, query, filter=None, top_k=3):
         """搜索相关文档"""
@@ -87,28 +403,40 @@ class ChromaVectorStore(BaseVectorStore):
             return []
 
         # 确保过滤器格式正确
-        if filter and isinstance(filter, dict) and "metadata" not in filter:
-            # 转换为Chroma接受的过滤器格式
-            metadata_filter = {}
-            for key, value in filter.items():
-                metadata_filter[key] = {"$eq": value}
-            filter = {"metadata": metadata_filter}
-
-        return self.vector_store.similarity_search(
-            query=query,
+        where = _normalize_filter(filter)
+
+        query_vector = self.embedding.embed_query(query)
+        results = self.vector_store.similarity_search_by_vector_with_relevance_scores(
+            embedding=query_vector,
             k=top_k,
-            filter=filter
+            filter=where
         )
 
+        # 合并尚未落盘的文档，Chroma默认使用L2距离；缓冲区中的同ID文档比已落盘的更新
+        with self._lock:
+            buffered = [(doc, vector) for doc, vector in self._buffer.values() if _match_filter(doc.metadata, where)]
+            buffered_ids = set(self._buffer)
+        if buffered_ids:
+            results = [item for item in results if item[0].metadata.get("chunk_id") not in buffered_ids]
+        if buffered:
+            vectors = np.asarray([vector for _, vector in buffered], dtype=np.float32)
+            distances = ((vectors - np.asarray(query_vector, dtype=np.float32)) ** 2).sum(axis=1)
+            results.extend((doc, float(distance)) for (doc, _), distance in zip(buffered, distances))
+
+        results.sort(key=lambda item: item[1])
+        return [doc for doc, _ in results[:top_k]]
+
 
 class FAISSVectorStore(BaseVectorStore):
     """基于FAISS的向量存储"""
 
     def __init__(self, path, embedding):
         super().__init__(path, embedding)
-        self._initialize_store()
         self.index_file = os.path.join(self.path, "index.faiss")
-        self.docstore_file = os.path.join(self.path, "docstore.pickle")
+        self.docstore_file = os.path.join(self.path, "index.pkl")
+        self.metadata_index = MetadataIndex()
+        self._initialize_store()
+        self._ensure_keyword_index()
 
     def _initialize_store(self):
         """初始化向量存储"""
@@ -118,40 +446,129 @@ class FAISSVectorStore(BaseVectorStore):
             self.vector_store = FAISS.load_local(
                 folder_path=self.path,
                 embeddings=self.embedding,
-                index_name="index"
+                index_name="index",
+                allow_dangerous_deserialization=True
             )
+            self._rebuild_metadata_index()
         else:
-            self.vector_store = FAISS.from_documents(
-                documents=[],
-                embedding=self.embedding
-            )
+            # FAISS无法从空文档创建索引，首次写入时再创建
+            self.vector_store = None
+
+    def _rebuild_metadata_index(self):
+        """根据当前FAISS索引重建元数据索引"""
+        self.metadata_index.clear()
+        for position, doc_id in self.vector_store.index_to_docstore_id.items():
+            self.metadata_index.add(position, self.vector_store.docstore.search(doc_id).metadata)
 
     def add_documents(self, documents):
         """添加文档到向量存储"""
-        if not self.vector_store:
-            self._initialize_store()
+        if not documents:
+            return
 
+        embeddings = self.embedding.embed_documents([doc.page_content for doc in documents])
+        self.add_embeddings(documents, embeddings)
+
+    def add_embeddings(self, documents, embeddings):
+        """添加已计算好向量的文档到向量存储"""
         if not documents:
             return
 
-        self.vector_store.add_documents(documents)
-        self.vector_store.save_local(self.path, index_name="index")
+        text_embeddings = [(doc.page_content, vector) for doc, vector in zip(documents, embeddings)]
+        metadatas = [doc.metadata for doc in documents]
+        with self._lock:
+            ids = self._assign_ids(documents)
+            # 按ID覆盖写入：先删除已存在的同ID文档
+            if self.vector_store:
+                existing = [doc_id for doc_id in ids if doc_id in self.vector_store.docstore._dict]
+                if existing:
+                    self.vector_store.delete(existing)
+                    self._rebuild_metadata_index()
+            start = self.vector_store.index.ntotal if self.vector_store else 0
+            # 文档立即进入内存索引，可被检索；索引文件延迟写入
+            if not self.vector_store:
+                self.vector_store = FAISS.from_embeddings(
+                    text_embeddings=text_embeddings,
+                    embedding=self.embedding,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+            else:
+                self.vector_store.add_embeddings(text_embeddings=text_embeddings, metadatas=metadatas, ids=ids)
+            for offset, metadata in enumerate(metadatas):
+                self.metadata_index.add(start + offset, metadata)
+            self._mark_dirty(len(documents))
+
+    def delete(self, ids):
+        """按内容块ID删除文档"""
+        if not ids or not self.vector_store:
+            return
 
-    def search(self, query, filter=None, top_k=3):
-        """搜索相关文档"""
+        with self._lock:
+            existing = set(self.vector_store.index_to_docstore_id.values())
+            ids = [doc_id for doc_id in ids if doc_id in existing]
+            if not ids:
+                return
+            self.keyword_index.delete(ids)
+            self.vector_store.delete(ids)
+            # 删除后FAISS会重新编排向量位置，需要重建元数据索引
+            self._rebuild_metadata_index()
+            self._mark_dirty(len(ids))
+
+    def _find_ids(self, filter):
         if not self.vector_store:
             return []
+        positions = self.metadata_index.lookup(filter)
+        if positions is None:
+            return super()._find_ids(filter)
+        return [self.vector_store.index_to_docstore_id[position] for position in positions]
 
-        # FAISS不支持过滤，这里手动实现
-        results = self.vector_store.similarity_search(query=query, k=top_k * 2)
+    def _iter_stored_documents(self):
+        for doc_id in self.vector_store.index_to_docstore_id.values():
+            yield doc_id, self.vector_store.docstore.search(doc_id)
 
-        if filter:
-            filtered_results = []
-            for doc in results:
-                if all(doc.metadata.get(k) == v for k, v in filter.items()):
-                    filtered_results.append(doc)
-                    if len(filtered_results) >= top_k:
-                        break
-            return filtered_results[:top_k]
+    def _get_documents(self, ids):
+        if not self.vector_store:
+            return []
+        stored = self.vector_store.docstore._dict
+        return [stored[doc_id] for doc_id in ids if doc_id in stored]
 
-        return results[:top_k]
+    def _persist(self):
+        """将内存索引写入磁盘"""
+        if self.vector_store:
+            self.vector_store.save_local(self.path, index_name="index")
+
+    def search(self, query, filter=None, top_k=3):
+        """搜索相关文档，带过滤条件时只在满足条件的向量中检索"""
+        if not self.vector_store:
+            return []
+
+        # faiss 只在使用FAISS存储时才需要安装
+        faiss = dependable_faiss_import()
+        query_vector = np.array([self.embedding.embed_query(query)], dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            faiss.normalize_L2(query_vector)
+
+        with self._lock:
+            params = None
+            k = top_k
+            if filter:
+                positions = self.metadata_index.lookup(filter)
+                if positions is None:
+                    return self._search_and_filter(query, filter, top_k)
+                if not positions:
+                    return []
+                selector = faiss.IDSelectorBatch(np.fromiter(positions, dtype=np.int64, count=len(positions)))
+                params = faiss.SearchParameters(sel=selector)
+                k = min(top_k, len(positions))
+
+            _, indices = self.vector_store.index.search(query_vector, k, params=params)
+            return [
+                self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[int(i)])
+                for i in indices[0] if i != -1
+            ]
+
+    def _search_and_filter(self, query, filter, top_k):
+        """元数据索引不支持的过滤条件，先多取结果再手动过滤"""
+        results = self.vector_store.similarity_search(query=query, k=top_k * 2)
+        where = _normalize_filter(filter)
+        return [doc for doc in results if _match_filter(doc.metadata, where)][:top_k]
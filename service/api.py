@@ -1,12 +1,21 @@
 # service/api.py
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
+import asyncio
+import json
 import tempfile
 import os
 import uuid
 
+from infrastructure.config import Config
+from infrastructure.database import InvalidCursorError
+from infrastructure.models import ModelProvider
+from knowledge_base.vector_store import VectorStoreFactory
 from service.chat_service import ChatService
+from service.job_manager import JobManager
+from tools.file_parser import FileParserService
 
 
 # 定义请求和响应模型
@@ -24,11 +33,29 @@ class FileUploadResponse(BaseModel):
     message: str
     file_id: str
     session_id: str
+    job_id: str
 
 
 # 创建应用
 app = FastAPI(title="智能客服Agent系统API")
 chat_service = ChatService()
+job_manager = JobManager()
+file_parser = FileParserService(chat_service.agent_system.knowledge_base)
+
+
+@app.on_event("startup")
+async def startup():
+    """启动后台任务"""
+    chat_service.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """关闭服务时持久化尚未落盘的数据"""
+    await job_manager.close()
+    VectorStoreFactory.flush_all()
+    await chat_service.close()
+    await ModelProvider.aclose()
 
 
 @app.post("/chat", response_model=ChatResponse)
@@ -44,12 +71,32 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=f"处理消息出错: {str(e)}")
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """流式处理聊天请求，以SSE方式逐个返回token和工具调用事件"""
+
+    async def event_stream():
+        try:
+            async for event in chat_service.stream_message(
+                user_query=request.query,
+                session_id=request.session_id
+            ):
+                yield f"data: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+        except Exception as e:
+            error = {"type": "error", "message": f"处理消息出错: {str(e)}"}
+            yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.get("/history/{session_id}")
-async def get_history(session_id: str, limit: int = 10):
-    """获取会话历史"""
+async def get_history(session_id: str, limit: int = Query(10, ge=1, le=100), cursor: str = None):
+    """获取会话历史，使用上一页返回的 next_cursor 继续翻页"""
     try:
-        history = chat_service.get_conversation_history(session_id, limit)
-        return {"session_id": session_id, "history": history}
+        history, next_cursor = await chat_service.get_conversation_history(session_id, limit, cursor)
+        return {"session_id": session_id, "history": history, "next_cursor": next_cursor}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取历史记录出错: {str(e)}")
 
@@ -58,41 +105,100 @@ async def get_history(session_id: str, limit: int = 10):
 async def upload_file(
     file: UploadFile = File(...),
     session_id: str = Form(None),
-    description: str = Form("这是一个上传的文件，请解析它的内容")
+    description: str = Form(None),
+    doc_id: str = Form(None)
 ):
-    """上传并处理文件"""
+    """上传文件，文件在后台解析并写入知识库，通过 /jobs/{job_id} 查询处理结果和文档ID；传入 doc_id 时替换该文档"""
+    # 获取文件扩展名
+    file_extension = os.path.splitext(file.filename)[1].lower().lstrip('.')
+    if file_extension not in file_parser.supported_formats:
+        raise HTTPException(status_code=400, detail=f"不支持的文件类型: {file_extension}")
+
     try:
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-
-        # 获取文件扩展名
-        file_extension = os.path.splitext(file.filename)[1].lower().lstrip('.')
-        
-        # 构建处理消息
+        # 分块写入临时文件，文件写入放到线程中执行，不阻塞事件循环
+        temp_file_path = await _save_upload(file, file_extension)
+
+        # 内容块的来源记为原始文件名，而不是临时文件路径
         session_id = session_id or str(uuid.uuid4())
-        file_query = f"{description}。文件路径: {temp_file_path}，文件类型: {file_extension}，文件名: {file.filename}"
-        
-        # 使用聊天服务处理文件（会自动路由到FileParserAgent）
-        result = await chat_service.process_message(
-            user_query=file_query,
+        metadata = {"source": file.filename, "filename": file.filename}
+        if description:
+            metadata["description"] = description
+
+        # 在后台解析并写入知识库，结束后清理临时文件
+        job_id = job_manager.submit(
+            _process_upload,
+            temp_file_path,
+            file_extension,
+            metadata,
+            session_id,
+            doc_id,
+            on_done=lambda: _remove_file(temp_file_path),
+            filename=file.filename,
             session_id=session_id
         )
 
-        # 清理临时文件
-        os.unlink(temp_file_path)
-        
         return FileUploadResponse(
-            message=result["response"],
+            message="文件已接收，正在后台处理",
             file_id=session_id,  # 使用session_id作为文件标识
-            session_id=result["session_id"]
+            session_id=session_id,
+            job_id=job_id
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件处理出错: {str(e)}")
 
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询后台任务状态：pending、running、succeeded、failed 或 cancelled"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return job
+
+
+async def _save_upload(file: UploadFile, file_extension: str) -> str:
+    """将上传文件分块写入临时文件，返回文件路径"""
+    suffix = f".{file_extension}" if file_extension else ""
+    temp_file = await asyncio.to_thread(
+        tempfile.NamedTemporaryFile, delete=False, suffix=suffix, dir=Config.UPLOAD_DIR
+    )
+    try:
+        while True:
+            chunk = await file.read(Config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await asyncio.to_thread(temp_file.write, chunk)
+    except Exception:
+        temp_file.close()
+        _remove_file(temp_file.name)
+        raise
+    finally:
+        await file.close()
+    await asyncio.to_thread(temp_file.close)
+    return temp_file.name
+
+
+async def _process_upload(file_path: str, file_type: str, metadata: dict, session_id: str, doc_id: str = None) -> dict:
+    """后台解析上传文件并写入知识库，返回 {"doc_id", "chunks", "filename", "message"}"""
+    result = await asyncio.to_thread(file_parser.ingest_file, file_path, file_type, metadata, doc_id)
+    filename = metadata["filename"]
+    message = f"文件 {filename} 已解析并存入知识库，文档ID: {result['doc_id']}，共 {result['chunks']} 个内容块。"
+
+    # 记入会话历史，便于在该会话中查看上传记录
+    await chat_service.conversation_db.save_conversation(
+        session_id=session_id,
+        user_query=f"上传文件: {filename}",
+        response=message
+    )
+    return {"doc_id": result["doc_id"], "chunks": result["chunks"], "filename": filename, "message": message}
+
+
+def _remove_file(file_path: str):
+    """删除临时文件"""
+    if os.path.exists(file_path):
+        os.unlink(file_path)
+
+
 def start_api():
     """启动API服务"""
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,27 +1,43 @@
 # service/chat_service.py
+import logging
 import uuid
 
 from core.agent_system import AgentSystem
+from infrastructure.config import Config
 from infrastructure.database import ConversationDB
 import asyncio
 
+logger = logging.getLogger(__name__)
+
+
 class ChatService:
     """聊天服务，处理用户交互"""
 
     def __init__(self):
         self.agent_system = AgentSystem()
         self.conversation_db = ConversationDB()
+        self._retention_task = None
+
+    def start(self):
+        """启动后台任务：定期归档过期会话"""
+        if Config.CONVERSATION_RETENTION_DAYS > 0 and self._retention_task is None:
+            self._retention_task = asyncio.get_running_loop().create_task(
+                self.conversation_db.run_retention(
+                    Config.CONVERSATION_RETENTION_DAYS,
+                    Config.CONVERSATION_ARCHIVE_INTERVAL
+                )
+            )
 
     async def process_message(self, user_query, user_id=None, session_id=None):
         """处理用户消息"""
         session_id = session_id or str(uuid.uuid4())
         user_id = user_id or str(uuid.uuid4())
 
-        # 调用Agent系统处理消息
+        # 调用Agent系统处理消息；与用户无关的专家回答在路由Agent转给专家时缓存
         response = await self.agent_system.process_query(user_query, user_id, session_id)
 
         # 保存对话记录
-        self.conversation_db.save_conversation(
+        await self.conversation_db.save_conversation(
             session_id=session_id,
             user_query=user_query,
             response=response
@@ -30,13 +46,54 @@ class ChatService:
         return {"session_id": session_id, "response": response}
 
 
-    def get_conversation_history(self, session_id, limit=10):
-        """获取会话历史"""
-        return self.conversation_db.get_conversation_history(session_id, limit)
+    async def stream_message(self, user_query, user_id=None, session_id=None):
+        """流式处理用户消息，逐个产出token和工具调用事件，结束后保存对话记录"""
+        session_id = session_id or str(uuid.uuid4())
+        user_id = user_id or str(uuid.uuid4())
+        response = ""
+
+        async for event in self.agent_system.astream_query(user_query, user_id, session_id):
+            kind = event["event"]
+            agent_name = event.get("metadata", {}).get("agent_name")
+
+            if kind == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                if content:
+                    yield {"type": "token", "agent": agent_name, "content": content}
+            elif kind == "on_chat_model_end" and agent_name == "router_agent":
+                # 路由Agent最后一次模型输出即为最终回复
+                response = event["data"]["output"].content or response
+            elif kind == "on_tool_start":
+                yield {"type": "tool_start", "agent": agent_name, "tool": event["name"],
+                       "input": event["data"].get("input")}
+            elif kind == "on_tool_end":
+                yield {"type": "tool_end", "agent": agent_name, "tool": event["name"]}
+
+        await self.conversation_db.save_conversation(
+            session_id=session_id,
+            user_query=user_query,
+            response=response
+        )
+        yield {"type": "end", "session_id": session_id, "response": response}
+
+    async def get_conversation_history(self, session_id, limit=10, cursor=None):
+        """获取会话历史，返回 (记录列表, 下一页游标)"""
+        return await self.conversation_db.get_conversation_history(session_id, limit, cursor)
+
+    async def close(self):
+        """关闭服务，提交尚未写入的对话记录"""
+        if self._retention_task is not None:
+            self._retention_task.cancel()
+            self._retention_task = None
+        await self.conversation_db.close()
 
 
 if __name__ == "__main__":
     import asyncio
 
-    chat_service = ChatService()
-    asyncio.run(chat_service.process_message("你好"))
+    async def main():
+        chat_service = ChatService()
+        await chat_service.process_message("你好")
+        await chat_service.close()
+
+    asyncio.run(main())
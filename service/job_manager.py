@@ -0,0 +1,101 @@
+# service/job_manager.py
+import asyncio
+import logging
+import time
+import uuid
+
+from infrastructure.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class JobManager:
+    """后台任务管理：限制同时执行的任务数，记录任务状态供查询"""
+
+    def __init__(self, max_concurrency=None, ttl=None):
+        self.max_concurrency = max_concurrency or Config.JOB_MAX_CONCURRENCY
+        self.ttl = Config.JOB_TTL if ttl is None else ttl
+        self._semaphore = None
+        self._jobs = {}
+        self._tasks = {}
+        self._on_done = {}
+
+    def submit(self, func, *args, on_done=None, **info):
+        """提交异步任务，立即返回任务ID；on_done 在任务结束后（无论成功与否）调用"""
+        self._prune()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        job_id = str(uuid.uuid4())
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": "pending",
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+            **info
+        }
+        if on_done is not None:
+            self._on_done[job_id] = on_done
+        self._tasks[job_id] = asyncio.get_running_loop().create_task(self._run(job_id, func, args))
+        return job_id
+
+    def get(self, job_id):
+        """获取任务状态，任务不存在或已过期时返回None"""
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def close(self):
+        """取消尚未完成的任务"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 尚未开始执行就被取消的任务不会进入 _run，这里补记状态并执行清理
+        for job_id, job in self._jobs.items():
+            if job["finished_at"] is None:
+                job["status"] = "cancelled"
+                job["finished_at"] = time.time()
+                self._finish(job_id)
+
+    async def _run(self, job_id, func, args):
+        job = self._jobs[job_id]
+        try:
+            async with self._semaphore:
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                job["result"] = await func(*args)
+                job["status"] = "succeeded"
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"后台任务 {job_id} 执行出错: {str(e)}", exc_info=True)
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            self._finish(job_id)
+
+    def _finish(self, job_id):
+        """移除任务句柄并执行清理回调"""
+        self._tasks.pop(job_id, None)
+        on_done = self._on_done.pop(job_id, None)
+        if on_done is not None:
+            try:
+                on_done()
+            except Exception as e:
+                logger.warning(f"后台任务 {job_id} 清理出错: {str(e)}")
+
+    def _prune(self):
+        """清理已结束且超过保留时间的任务记录"""
+        if self.ttl <= 0:
+            return
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
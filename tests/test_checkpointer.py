@@ -0,0 +1,62 @@
+# tests/test_checkpointer.py
+import sqlite3
+
+import pytest
+
+pytest.importorskip("langgraph.checkpoint.sqlite")
+
+from langgraph.checkpoint.base import empty_checkpoint
+
+from infrastructure.checkpointer import ThreadedSqliteSaver
+
+
+def put_checkpoints(saver, thread_id, count):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    for _ in range(count):
+        config = saver.put(config, empty_checkpoint(), {}, {})
+        saver.put_writes(config, [("messages", "hi")], "task")
+    return config
+
+
+def count_rows(saver, table, thread_id):
+    return saver.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+
+def test_keeps_only_recent_checkpoints(tmp_path):
+    saver = ThreadedSqliteSaver(sqlite3.connect(str(tmp_path / "agent.db"), check_same_thread=False),
+                                max_threads=10, ttl=0, max_checkpoints=2)
+    config = put_checkpoints(saver, "t1", 5)
+
+    assert count_rows(saver, "checkpoints", "t1") == 2
+    # 最早的检查点的中间写入随之删除，只剩最近两个检查点的写入
+    assert count_rows(saver, "writes", "t1") == 2
+    assert saver.get_tuple(config).config["configurable"]["checkpoint_id"] == config["configurable"]["checkpoint_id"]
+
+
+def test_evicts_least_recently_used_and_idle_threads(tmp_path):
+    saver = ThreadedSqliteSaver(sqlite3.connect(str(tmp_path / "agent.db"), check_same_thread=False),
+                                max_threads=2, ttl=3600, max_checkpoints=2)
+    for thread_id in ("t1", "t2", "t3"):
+        put_checkpoints(saver, thread_id, 1)
+
+    assert count_rows(saver, "checkpoints", "t1") == 0
+    assert count_rows(saver, "writes", "t1") == 0
+    assert count_rows(saver, "checkpoints", "t2") == 1
+
+    # t2 空闲超过TTL，下一次写入时被淘汰
+    saver.conn.execute("UPDATE thread_access SET last_access = last_access - 7200 WHERE thread_id = 't2'")
+    put_checkpoints(saver, "t3", 1)
+    assert count_rows(saver, "checkpoints", "t2") == 0
+    assert count_rows(saver, "checkpoints", "t3") == 2
+
+
+def test_existing_threads_are_tracked_after_upgrade(tmp_path):
+    path = str(tmp_path / "agent.db")
+    legacy = ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False), max_checkpoints=5)
+    put_checkpoints(legacy, "old", 1)
+    legacy.conn.execute("DROP TABLE thread_access")
+    legacy.conn.commit()
+
+    saver = ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False), max_threads=1, ttl=0)
+    put_checkpoints(saver, "new", 1)
+    assert count_rows(saver, "checkpoints", "old") == 0
@@ -0,0 +1,55 @@
+# tests/test_database.py
+import asyncio
+import sqlite3
+
+from infrastructure.database import ConversationDB
+
+
+async def save_and_archive(db, session_id):
+    await db.save_conversation(session_id, "你好", "您好")
+    await db.flush()
+    # 保留期为负数时所有会话都已过期
+    return await db.archive_old_sessions(-1)
+
+
+def archived_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT id, session_id FROM conversations_archive ORDER BY id").fetchall()
+
+
+def test_archive_does_not_reuse_ids(tmp_path):
+    path = str(tmp_path / "conversations.db")
+
+    async def run():
+        db = ConversationDB(path, pool_size=1, batch_size=1, flush_interval=0)
+        try:
+            assert await save_and_archive(db, "s1") == 1
+            assert await save_and_archive(db, "s2") == 1
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+    assert archived_rows(path) == [(1, "s1"), (2, "s2")]
+
+
+def test_legacy_database_is_migrated(tmp_path):
+    path = str(tmp_path / "conversations.db")
+    with sqlite3.connect(path) as conn:
+        for table in ("conversations", "conversations_archive"):
+            conn.execute(
+                f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, session_id TEXT, user_query TEXT, "
+                f"response TEXT, timestamp TEXT, metadata TEXT, created_at INTEGER)"
+            )
+        conn.execute("PRAGMA user_version = 1")
+        # 旧库中 id=1 已归档且已从对话表删除，新记录会复用 id=1
+        conn.execute("INSERT INTO conversations_archive (id, session_id) VALUES (1, 's0')")
+
+    async def run():
+        db = ConversationDB(path, pool_size=1, batch_size=1, flush_interval=0)
+        try:
+            assert await save_and_archive(db, "s1") == 1
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+    assert archived_rows(path) == [(1, "s0"), (2, "s1")]
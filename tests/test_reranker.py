@@ -0,0 +1,46 @@
+# tests/test_reranker.py
+import os
+import stat
+import threading
+import time
+from multiprocessing import AuthenticationError
+
+import pytest
+
+from knowledge_base import reranker
+from knowledge_base.reranker import RemoteReranker, serve_reranker
+
+
+class FakeModel:
+    def compute_score(self, pairs, batch_size=32, max_length=512):
+        return [float(len(passage)) for _, passage in pairs]
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(reranker, "_load_local_model", FakeModel)
+    # AF_UNIX 路径长度有限，不使用 pytest 的深层临时目录
+    path = os.path.join("/tmp", f"reranker-test-{os.getpid()}.sock")
+    threading.Thread(target=serve_reranker, args=(path, "secret"), daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.01)
+    # 监听线程随测试进程退出，socket文件由 Listener 在退出时删除
+    return path
+
+
+def test_remote_reranker_requires_authkey(socket_path):
+    assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+
+    with pytest.raises(AuthenticationError):
+        RemoteReranker(socket_path, "wrong").compute_score([["q", "abc"]])
+
+    # 认证失败的连接不影响后续请求
+    assert RemoteReranker(socket_path, "secret").compute_score([["q", "abc"], ["q", "a"]]) == [3.0, 1.0]
+
+
+def test_socket_without_authkey_is_rejected(monkeypatch):
+    monkeypatch.setattr(reranker.Config, "RERANKER_AUTHKEY", None)
+    with pytest.raises(ValueError):
+        RemoteReranker("/tmp/unused.sock")
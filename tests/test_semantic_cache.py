@@ -0,0 +1,49 @@
+# tests/test_semantic_cache.py
+from collections import Counter
+
+from infrastructure.semantic_cache import ExpertAnswerCache, SemanticCache
+
+
+class CharEmbedding:
+    """按字符计数的假向量，字面相近的问题向量也相近"""
+
+    def embed_query(self, text):
+        counts = Counter(text)
+        return [counts.get(chr(code), 0) for code in range(0x20, 0x7f)] + [
+            sum(v for k, v in counts.items() if ord(k) >= 0x7f)
+        ]
+
+
+def make_cache():
+    cache = SemanticCache(CharEmbedding(), threshold=0.95, ttl=0, max_entries=100)
+    return ExpertAnswerCache(cache, shared_experts={"product_expert"}, skip_tools={"ticket_creator"})
+
+
+def test_users_with_different_context_and_memory_do_not_share_answers():
+    cache = make_cache()
+
+    # 用户A有记忆，路由Agent把上下文和偏好改写进转给专家的问题，回答只属于A
+    query_a = "AB-123 红色款多少钱（用户偏好红色）"
+    assert cache.lookup("product_expert", query_a) is None
+    assert not cache.store("product_expert", query_a, "红色款 AB-123 售价 99 元，很适合您", has_user_memory=True)
+
+    # 用户B问的也是“它多少钱”，但上下文里的商品是 CD-456
+    query_b = "CD-456 多少钱"
+    assert cache.lookup("product_expert", query_b) is None
+    assert cache.store("product_expert", query_b, "CD-456 售价 199 元")
+
+    # 用户C的上下文是 AB-123：既拿不到A的个性化回答，也不能因为问法相近拿到B的回答
+    assert cache.lookup("product_expert", "AB-123 多少钱") is None
+
+    # 与用户无关的同一问题可以跨用户复用
+    assert cache.lookup("product_expert", "CD-456 多少钱？") == "CD-456 售价 199 元"
+
+
+def test_side_effect_tools_and_unshared_experts_are_not_cached():
+    cache = make_cache()
+
+    assert not cache.store("product_expert", "AB-123 坏了", "已为您创建工单 T-1", tool_names=["ticket_creator"])
+    assert cache.lookup("product_expert", "AB-123 坏了") is None
+
+    assert not cache.store("order_expert", "订单 1001 到哪了", "订单 1001 已发货")
+    assert cache.lookup("order_expert", "订单 1001 到哪了") is None
@@ -0,0 +1,112 @@
+# tools/excel_parser.py
+import datetime
+import logging
+import os
+from typing import Any, Dict, Iterable, Iterator, List
+
+from infrastructure.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _format_cell(value) -> str:
+    """单元格值转为文本，整数值的浮点数去掉小数部分"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def iter_excel_chunks(file_path: str, rows_per_chunk: int = None, max_chunk_chars: int = None,
+                      max_rows_per_sheet: int = None) -> Iterator[Dict[str, Any]]:
+    """单次流式读取Excel，按行分组产出 {"content", "metadata"}，每个分组都重复表头"""
+    rows_per_chunk = rows_per_chunk or Config.EXCEL_ROWS_PER_CHUNK
+    max_chunk_chars = max_chunk_chars or Config.EXCEL_MAX_CHUNK_CHARS
+    max_rows_per_sheet = Config.EXCEL_MAX_ROWS_PER_SHEET if max_rows_per_sheet is None else max_rows_per_sheet
+
+    for sheet_name, rows in _iter_sheets(file_path, max_rows_per_sheet):
+        yield from _iter_row_groups(file_path, sheet_name, rows, rows_per_chunk, max_chunk_chars, max_rows_per_sheet)
+
+
+def _iter_sheets(file_path: str, max_rows_per_sheet: int) -> Iterator[tuple]:
+    """逐个产出 (工作表名, 行迭代器)；xlsx 只读流式读取，xls 由 pandas 读取"""
+    if os.path.splitext(file_path)[1].lower() == ".xls":
+        # openpyxl 不支持旧版 xls，工作簿只打开一次，按工作表依次解析
+        import pandas as pd
+
+        with pd.ExcelFile(file_path) as xls:
+            for sheet_name in xls.sheet_names:
+                # 多读一行表头
+                nrows = max_rows_per_sheet + 1 if max_rows_per_sheet else None
+                df = xls.parse(sheet_name, header=None, nrows=nrows)
+                yield sheet_name, df.itertuples(index=False, name=None)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield worksheet.title, worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_row_groups(file_path: str, sheet_name: str, rows: Iterable[tuple], rows_per_chunk: int,
+                     max_chunk_chars: int, max_rows_per_sheet: int) -> Iterator[Dict[str, Any]]:
+    """将一个工作表的行按数量和字符数分组，第一行非空行作为表头"""
+    header = None
+    group: List[str] = []
+    group_chars = 0
+    first_row = last_row = row_count = 0
+
+    def build_chunk():
+        return {
+            "content": "\n".join([f"工作表: {sheet_name}", header] + group),
+            "metadata": {
+                "source": file_path,
+                "sheet": sheet_name,
+                "type": "excel",
+                "row_start": first_row,
+                "row_end": last_row
+            }
+        }
+
+    for row_number, row in enumerate(rows, start=1):
+        cells = [_format_cell(value) for value in row]
+        # 去掉行尾的空单元格，跳过空行
+        while cells and not cells[-1]:
+            cells.pop()
+        if not cells:
+            continue
+        line = " | ".join(cells)
+
+        if header is None:
+            header = line
+            first_row = last_row = row_number
+            continue
+
+        if max_rows_per_sheet and row_count >= max_rows_per_sheet:
+            logger.warning(f"工作表 {sheet_name} 超过 {max_rows_per_sheet} 行，剩余行已忽略：{file_path}")
+            break
+
+        if group and (len(group) >= rows_per_chunk or group_chars + len(line) > max_chunk_chars):
+            yield build_chunk()
+            group, group_chars = [], 0
+
+        if not group:
+            first_row = row_number
+        group.append(line)
+        group_chars += len(line) + 1
+        last_row = row_number
+        row_count += 1
+
+    # 只有表头的工作表也产出一个分组
+    if group or header is not None and row_count == 0:
+        yield build_chunk()
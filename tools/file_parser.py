@@ -1,23 +1,29 @@
 # tools/file_parser.py
 
 from langchain.tools import StructuredTool
-from typing import List, Dict, Any, Optional
-import fitz  # PyMuPDF for PDF
-import pandas as pd  # for Excel
-from PIL import Image
-import pytesseract  # for OCR
+from langchain_core.documents import Document
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 import os
 
+from knowledge_base.document_loader import DocumentLoader
+from knowledge_base.embedding_pipeline import EmbeddingPipeline
+from knowledge_base.manifest import make_doc_id
+from tools.excel_parser import iter_excel_chunks
+from tools.ocr import get_ocr_engine
+from tools.pdf_parser import get_pdf_parser
+
 
 class FileParserService:
     """文件解析服务"""
     
     def __init__(self, knowledge_base=None):
         self.knowledge_base = knowledge_base
+        self.pipeline = EmbeddingPipeline(knowledge_base) if knowledge_base else None
+        # 各解析器逐块产出 {"content", "metadata"}
         self.supported_formats = {
-            "pdf": self._parse_pdf,
-            "xlsx": self._parse_excel,
-            "xls": self._parse_excel,
+            "pdf": self._iter_pdf,
+            "xlsx": iter_excel_chunks,
+            "xls": iter_excel_chunks,
             "jpg": self._parse_image,
             "jpeg": self._parse_image,
             "png": self._parse_image
@@ -32,61 +38,78 @@ class FileParserService:
             if file_type not in self.supported_formats:
                 return f"抱歉，不支持的文件类型: {file_type}。目前支持的格式有: PDF, Excel, JPG, PNG。"
             
-            parser_func = self.supported_formats[file_type]
-            chunks = parser_func(file_path)
-            
             # 存储到向量数据库
             if self.knowledge_base:
-                file_id = self.knowledge_base.add_documents(chunks)
-                return f"文件已成功解析并存储。文件ID: {file_id}，共提取了 {len(chunks)} 个内容块。"
+                result = self.ingest_file(file_path, file_type)
+                return f"文件已成功解析并存储。文件ID: {result['doc_id']}，共提取了 {result['chunks']} 个内容块。"
             else:
-                return f"文件已成功解析，共提取了 {len(chunks)} 个内容块，但未存储。"
+                chunk_count = sum(1 for _ in self.supported_formats[file_type](file_path))
+                return f"文件已成功解析，共提取了 {chunk_count} 个内容块，但未存储。"
         except Exception as e:
             return f"解析文件时出错: {str(e)}"
 
+    def ingest_file(self, file_path: str, file_type: str = None, metadata: Dict[str, Any] = None,
+                    doc_id: str = None) -> Dict[str, Any]:
+        """解析文件并分批嵌入写入知识库，传入已有 doc_id 时替换该文档，返回 {"doc_id", "chunks", "stats"}"""
+        if not self.knowledge_base:
+            raise ValueError("知识库尚未初始化")
+        file_type = file_type or os.path.splitext(file_path)[1].lower().lstrip('.')
+        if file_type not in self.supported_formats:
+            raise ValueError(f"不支持的文件类型: {file_type}")
+
+        # 未指定文档ID时由来源（上传的文件名或文件路径）决定，同一来源再次入库时替换旧版本
+        doc_id = doc_id or make_doc_id((metadata or {}).get("source") or file_path)
+
+        # 内容块ID为 <文档ID>-<序号>，新内容块按ID覆盖写入；全部写入后再删除旧版本多出的内容块，
+        # 解析或嵌入中途失败时旧版本仍然完整
+        chunk_ids = []
+        chunks = self._iter_documents(self.supported_formats[file_type](file_path), doc_id, metadata, chunk_ids)
+        stats = self.pipeline.ingest_stream(chunks)
+        stale = set(self.knowledge_base.find_ids({"doc_id": doc_id})) - set(chunk_ids)
+        if stale:
+            self.knowledge_base.delete(list(stale))
+        return {"doc_id": doc_id, "chunks": stats["chunks"], "stats": stats}
+
+    def delete_document(self, doc_id: str) -> int:
+        """删除文档ID对应的所有内容块，返回删除的数量"""
+        return self.knowledge_base.delete_by_filter({"doc_id": doc_id})
+
+    @staticmethod
+    def _iter_documents(parsed: Iterable[Dict[str, Any]], doc_id: str, metadata: Dict[str, Any] = None,
+                        chunk_ids: List[str] = None) -> Iterator[Document]:
+        """将解析结果转换为文档并分割（Excel行分组保持原样），内容块ID为 <文档ID>-<序号>，并记入 chunk_ids"""
+        index = 0
+        for item in parsed:
+            if not item["content"].strip():
+                continue
+            document = Document(
+                page_content=item["content"],
+                metadata={**item["metadata"], **(metadata or {}), "doc_id": doc_id}
+            )
+            # Excel 行分组已按字符数切好并各自带表头，再分割会把表头和数据行拆开
+            chunks = [document] if item["metadata"].get("type") == "excel" else DocumentLoader.split_documents([document])
+            for chunk in chunks:
+                chunk.metadata["chunk_id"] = f"{doc_id}-{index}"
+                if chunk_ids is not None:
+                    chunk_ids.append(chunk.metadata["chunk_id"])
+                index += 1
+                yield chunk
+
+    def _iter_pdf(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """逐页解析PDF文件"""
+        return get_pdf_parser().iter_pages(file_path)
+
     def _parse_pdf(self, file_path: str) -> List[Dict[str, Any]]:
-        """解析PDF文件"""
-        doc = fitz.open(file_path)
-        chunks = []
-        
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            text = page.get_text()
-            chunks.append({
-                "content": text,
-                "metadata": {
-                    "source": file_path,
-                    "page": page_num + 1,
-                    "type": "pdf"
-                }
-            })
-        
-        doc.close()
-        return chunks
+        """解析PDF文件，扫描页自动走OCR"""
+        return list(self._iter_pdf(file_path))
 
     def _parse_excel(self, file_path: str) -> List[Dict[str, Any]]:
-        """解析Excel文件"""
-        xls = pd.ExcelFile(file_path)
-        chunks = []
-        
-        for sheet_name in xls.sheet_names:
-            sheet_df = pd.read_excel(file_path, sheet_name=sheet_name)
-            text = sheet_df.to_string()
-            chunks.append({
-                "content": text,
-                "metadata": {
-                    "source": file_path,
-                    "sheet": sheet_name,
-                    "type": "excel"
-                }
-            })
-        
-        return chunks
+        """解析Excel文件，按行分组并重复表头"""
+        return list(iter_excel_chunks(file_path))
 
     def _parse_image(self, file_path: str) -> List[Dict[str, Any]]:
         """解析图片文件并提取文本"""
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image, lang='chi_sim+eng')
+        text = get_ocr_engine().ocr_image(file_path)
         
         return [{
             "content": text,
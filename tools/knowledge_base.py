@@ -1,7 +1,33 @@
 # tools/knowledge_base.py
+import threading
+
 from langchain.chains.retrieval_qa.base import RetrievalQA
 from langchain.tools import StructuredTool
-from langchain_openai import ChatOpenAI
+
+from infrastructure.models import ModelProvider
+
+# 检索问答链按 (知识库, 分类) 只构建一次，所有工具调用共享
+_qa_chains = {}
+_qa_chains_lock = threading.Lock()
+
+
+def get_retrieval_qa_chain(knowledge_base, category=None):
+    """获取共享的检索问答链，不存在时创建"""
+    # 链中持有知识库引用，保证 id 在缓存期间不被复用
+    key = (id(knowledge_base), category)
+    with _qa_chains_lock:
+        qa_chain = _qa_chains.get(key)
+        if qa_chain is None:
+            retriever = knowledge_base.as_retriever(
+                search_kwargs={"k": 5, "filter": {"category": category} if category and category != "general" else None}
+            )
+            qa_chain = RetrievalQA.from_chain_type(
+                llm=ModelProvider.get_shared_openai_model(temperature=0),
+                chain_type="stuff",
+                retriever=retriever
+            )
+            _qa_chains[key] = qa_chain
+        return qa_chain
 
 
 def create_knowledge_base_tool(knowledge_base, category=None):
@@ -12,24 +38,23 @@ def create_knowledge_base_tool(knowledge_base, category=None):
         if not knowledge_base:
             return "知识库尚未初始化"
 
-        retriever = knowledge_base.as_retriever(
-            search_kwargs={"k": 5, "filter": {"category": category} if category != "general" else None}
-        )
+        result = get_retrieval_qa_chain(knowledge_base, category).invoke({"query": query})
+        return result["result"]
 
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=ChatOpenAI(temperature=0),
-            chain_type="stuff",
-            retriever=retriever
-        )
+    async def query_knowledge_base_async(query: str) -> str:
+        """异步在知识库中搜索信息"""
+        if not knowledge_base:
+            return "知识库尚未初始化"
 
-        result = qa_chain.run(query)
-        return result
+        result = await get_retrieval_qa_chain(knowledge_base, category).ainvoke({"query": query})
+        return result["result"]
     
     name = f"{category}_knowledge_search" if category else "knowledge_search"
     description = f"在{category if category else ''}知识库中搜索信息。提供关键词或问题，返回相关信息。"
     
     return StructuredTool.from_function(
         func=query_knowledge_base,
+        coroutine=query_knowledge_base_async,
         name=name,
         description=description
     )
@@ -0,0 +1,219 @@
+# tools/ocr.py
+import atexit
+import hashlib
+import io
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Union
+
+from PIL import Image, ImageOps
+import pytesseract
+
+from infrastructure.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """根据灰度直方图计算Otsu二值化阈值"""
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background = background_sum = 0
+    best_threshold, best_variance = 127, 0.0
+    for i, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        background_sum += i * count
+        mean_background = background_sum / background
+        mean_foreground = (weighted_total - background_sum) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = i, variance
+    return best_threshold
+
+
+def preprocess_image(image: Image.Image, max_width: int = None, binarize: bool = None) -> Image.Image:
+    """OCR预处理：转灰度、按宽度缩小、Otsu二值化"""
+    max_width = max_width or Config.OCR_MAX_WIDTH
+    binarize = Config.OCR_BINARIZE if binarize is None else binarize
+
+    image = ImageOps.exif_transpose(image).convert("L")
+    if image.width > max_width:
+        height = round(image.height * max_width / image.width)
+        image = image.resize((max_width, height), Image.LANCZOS)
+    if binarize:
+        threshold = _otsu_threshold(image.histogram())
+        image = image.point(lambda p: 255 if p > threshold else 0)
+    return image
+
+
+def _find_cut(image: Image.Image, y: int, band: int) -> int:
+    """在 y 附近寻找最亮（最可能是行间空白）的一行作为切分位置"""
+    top = max(1, y - band)
+    bottom = min(image.height - 1, y + band)
+    if bottom <= top:
+        return y
+    # 缩放为单列后每个像素即为该行的平均亮度
+    rows = list(image.crop((0, top, image.width, bottom)).resize((1, bottom - top), Image.BOX).getdata())
+    return top + max(range(len(rows)), key=lambda i: (rows[i], -abs(top + i - y)))
+
+
+def split_tiles(image: Image.Image, tile_height: int = None) -> List[Image.Image]:
+    """将长图按行间空白切分为多个水平条带，便于并行识别"""
+    tile_height = tile_height or Config.OCR_TILE_HEIGHT
+    if image.height <= tile_height * 1.5:
+        return [image]
+
+    tiles = []
+    top = 0
+    band = tile_height // 10
+    while image.height - top > tile_height * 1.5:
+        cut = _find_cut(image, top + tile_height, band)
+        tiles.append(image.crop((0, top, image.width, cut)))
+        top = cut
+    tiles.append(image.crop((0, top, image.width, image.height)))
+    return tiles
+
+
+def _encode(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _prepare_tiles(data: bytes) -> List[bytes]:
+    """在工作进程中预处理并切分图片，返回各条带的PNG字节"""
+    return [_encode(tile) for tile in split_tiles(preprocess_image(Image.open(io.BytesIO(data))))]
+
+
+def _ocr_tile(data: bytes, lang: str, config: str) -> str:
+    """在工作进程中识别单个条带"""
+    return pytesseract.image_to_string(Image.open(io.BytesIO(data)), lang=lang, config=config)
+
+
+def ocr_local(data: bytes, lang: str = None, config: str = None) -> str:
+    """在当前进程中识别图片字节，供本身已运行在工作进程中的调用方使用，避免嵌套进程池"""
+    lang = lang or Config.OCR_LANG
+    config = Config.OCR_TESSERACT_CONFIG if config is None else config
+    return "\n".join(_ocr_tile(tile, lang, config).strip() for tile in _prepare_tiles(data))
+
+
+class OCREngine:
+    """OCR引擎：预处理和切分图片，在进程池中并行调用Tesseract，按图片内容哈希缓存结果"""
+
+    def __init__(self, max_workers=None, lang=None, config=None, cache_size=None):
+        self.max_workers = max_workers or Config.OCR_MAX_WORKERS
+        self.lang = lang or Config.OCR_LANG
+        self.config = Config.OCR_TESSERACT_CONFIG if config is None else config
+        self.cache_size = cache_size or Config.OCR_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        """工作进程池，首次使用时创建"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # 服务进程中有事件循环和连接池线程，使用 spawn 避免 fork 后子进程死锁
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def ocr_image(self, image: Union[str, bytes]) -> str:
+        """识别单张图片（文件路径或图片字节）中的文字"""
+        return self.ocr_images([image])[0]
+
+    def ocr_images(self, images: List[Union[str, bytes]]) -> List[str]:
+        """批量识别图片，所有图片的条带一起提交到进程池"""
+        results = [None] * len(images)
+        pending = {}
+        for i, image in enumerate(images):
+            data = image if isinstance(image, bytes) else self._read(image)
+            key = f"{self.lang}:{self.config}:{hashlib.sha256(data).hexdigest()}"
+            text = self._get_cached(key)
+            if text is not None:
+                results[i] = text
+            else:
+                pending.setdefault(key, []).append((i, data))
+
+        # 相同内容的图片只识别一次；预处理和识别都在进程池中进行
+        prepared = {key: self.executor.submit(_prepare_tiles, items[0][1]) for key, items in pending.items()}
+        futures = {
+            key: [self.executor.submit(_ocr_tile, tile, self.lang, self.config) for tile in future.result()]
+            for key, future in prepared.items()
+        }
+
+        for key, tile_futures in futures.items():
+            text = "\n".join(future.result().strip() for future in tile_futures)
+            self._put_cached(key, text)
+            for i, _ in pending[key]:
+                results[i] = text
+        return results
+
+    def get_stats(self):
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "cache_size": len(self._cache)
+            }
+
+    def shutdown(self):
+        """关闭工作进程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    @staticmethod
+    def _read(file_path):
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    def _get_cached(self, key):
+        with self._lock:
+            text = self._cache.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def _put_cached(self, key, text):
+        with self._lock:
+            self._cache[key] = text
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    """获取进程内共享的OCR引擎"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = OCREngine()
+                atexit.register(_engine.shutdown)
+    return _engine
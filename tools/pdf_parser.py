@@ -0,0 +1,141 @@
+# tools/pdf_parser.py
+import atexit
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF for PDF
+
+from infrastructure.config import Config
+from tools.ocr import get_ocr_engine
+
+logger = logging.getLogger(__name__)
+
+
+def _extract_range(file_path: str, start: int, end: int, min_chars: int, dpi: int) -> List[Tuple[int, str, Optional[bytes]]]:
+    """在工作进程中提取页码区间 [start, end) 的文本，无文本层的页面渲染为PNG交给OCR"""
+    pages = []
+    with fitz.open(file_path) as doc:
+        for page_num in range(start, end):
+            page = doc[page_num]
+            text = page.get_text()
+            image = None
+            if len(text.strip()) < min_chars:
+                image = page.get_pixmap(dpi=dpi).tobytes("png")
+            pages.append((page_num, text, image))
+    return pages
+
+
+class PDFParser:
+    """PDF解析器：按页码区间在进程池中并行提取文本，扫描页交给OCR，按页序流式产出"""
+
+    def __init__(self, max_workers=None, pages_per_task=None, min_text_chars=None, ocr_dpi=None):
+        self.max_workers = max_workers or Config.PDF_MAX_WORKERS
+        self.pages_per_task = pages_per_task or Config.PDF_PAGES_PER_TASK
+        self.min_text_chars = Config.PDF_MIN_TEXT_CHARS if min_text_chars is None else min_text_chars
+        self.ocr_dpi = ocr_dpi or Config.PDF_OCR_DPI
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """工作进程池，首次使用时创建"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # 服务进程中有事件循环和连接池线程，使用 spawn 避免 fork 后子进程死锁
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def iter_pages(self, file_path: str, stats: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+        """按页序逐页产出 {"content", "metadata"}；传入 stats 字典时写入页数、OCR页数和吞吐"""
+        stats = stats if stats is not None else {}
+        stats.update({"pages": 0, "ocr_pages": 0, "seconds": 0.0, "pages_per_second": 0.0})
+        start = time.perf_counter()
+
+        with fitz.open(file_path) as doc:
+            page_count = len(doc)
+        ranges = [(i, min(i + self.pages_per_task, page_count)) for i in range(0, page_count, self.pages_per_task)]
+
+        for pages in self._iter_ranges(file_path, ranges):
+            scanned = [(i, image) for i, (_, _, image) in enumerate(pages) if image is not None]
+            ocr_texts = get_ocr_engine().ocr_images([image for _, image in scanned]) if scanned else []
+            texts = [text for _, text, _ in pages]
+            for (i, _), text in zip(scanned, ocr_texts):
+                texts[i] = text
+
+            for (page_num, _, image), text in zip(pages, texts):
+                stats["pages"] += 1
+                stats["ocr_pages"] += image is not None
+                yield {
+                    "content": text,
+                    "metadata": {
+                        "source": file_path,
+                        "page": page_num + 1,
+                        "type": "pdf",
+                        "ocr": image is not None
+                    }
+                }
+
+        stats["seconds"] = time.perf_counter() - start
+        stats["pages_per_second"] = stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
+        logger.info(
+            f"PDF解析完成：{file_path}，{stats['pages']} 页（OCR {stats['ocr_pages']} 页），"
+            f"耗时 {stats['seconds']:.2f}s，{stats['pages_per_second']:.1f} pages/s"
+        )
+
+    def _iter_ranges(self, file_path, ranges):
+        """按顺序产出各页码区间的提取结果，同时在处理中的区间数有上限"""
+        args = (self.min_text_chars, self.ocr_dpi)
+        # 只有一个区间时直接在当前进程中提取，省去进程间传输
+        if len(ranges) <= 1:
+            for start, end in ranges:
+                yield _extract_range(file_path, start, end, *args)
+            return
+
+        ranges = iter(ranges)
+        pending = deque()
+        for start, end in ranges:
+            pending.append(self.executor.submit(_extract_range, file_path, start, end, *args))
+            if len(pending) >= self.max_workers * 2:
+                break
+        try:
+            while pending:
+                pages = pending.popleft().result()
+                for start, end in ranges:
+                    pending.append(self.executor.submit(_extract_range, file_path, start, end, *args))
+                    break
+                yield pages
+        finally:
+            # 调用方提前停止迭代时取消尚未开始的区间
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        """关闭工作进程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+_parser = None
+_parser_lock = threading.Lock()
+
+
+def get_pdf_parser():
+    """获取进程内共享的PDF解析器"""
+    global _parser
+    if _parser is None:
+        with _parser_lock:
+            if _parser is None:
+                _parser = PDFParser()
+                atexit.register(_parser.shutdown)
+    return _parser